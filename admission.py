@@ -0,0 +1,178 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+from flask import current_app, request, jsonify, g
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from werkzeug.utils import import_string
+from metrics import registry
+import math
+import time
+
+
+admitted_total = registry.counter("admission_admitted_total", "Requests let through admission control", ("route",))
+rejected_total = registry.counter("admission_rejected_total", "Requests answered 429 by admission control", ("route", "reason"))
+in_flight = registry.gauge("admission_in_flight", "Requests running on routes with a concurrency limit", ("route",))
+
+#limits of one route, rate in requests per second per client, concurrency per worker process
+RouteLimit = namedtuple("RouteLimit", ["rate", "burst", "concurrency"])
+
+
+class AdmissionBackend:
+    """
+    Where the token buckets live. MemoryBackend limits every worker process on its own,
+    a shared backend (Redis, memcached...) must do take() atomically on the server so
+    the limits hold across processes. Set ADMISSION_BACKEND to "package.module:Class",
+    the class is built with the app config
+    """
+    def take(self, key, rate, burst):
+        """
+        Takes a token from the bucket of key, refilled with rate tokens per second up to burst.
+        Returns 0 when there was one, otherwise the seconds until there is
+        """
+        raise NotImplementedError
+
+
+class MemoryBackend(AdmissionBackend):
+    """
+    Buckets in a dict, the least recently used one is dropped past maxsize,
+    which only gives that client a full bucket again
+    """
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  #key -> [tokens, updated at]
+        self._lock = Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / rate
+
+
+class ConcurrencyLimit:
+    def __init__(self, route, limit):
+        self.route = route
+        self.limit = limit
+        self.running = 0
+        self._lock = Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.running >= self.limit:
+                return False
+            self.running += 1
+            in_flight.set((self.route,), self.running)
+            return True
+
+    def release(self):
+        with self._lock:
+            self.running -= 1
+            in_flight.set((self.route,), self.running)
+
+
+def admission_limit(rate=None, burst=None, concurrency=None):
+    """
+    Declares limits of an expensive route on top of the per-user bucket: rate requests
+    per second (with bursts of burst) per client, at most concurrency requests at once
+    per worker process. Goes under @query_budget
+    """
+    def decorator(func):
+        func.admission_limit = RouteLimit(rate, burst or rate, concurrency)
+        return func
+    return decorator
+
+
+def get_admission_backend():
+    backend = current_app.extensions.get("admission")
+    if backend is None:
+        config = current_app.config
+        if config["ADMISSION_BACKEND"] == "memory":
+            backend = MemoryBackend(config["ADMISSION_MAX_KEYS"])
+        else:
+            backend = import_string(config["ADMISSION_BACKEND"].replace(":", "."))(config)
+        backend = current_app.extensions.setdefault("admission", backend)
+    return backend
+
+
+def _client_key():
+    """
+    The JWT identity without a query, or the address for anonymous and invalid tokens
+    """
+    try:
+        if verify_jwt_in_request(optional=True):
+            return f"user:{get_jwt_identity()}"
+    except (JWTExtendedException, PyJWTError): #the view answers 401
+        pass
+    return f"ip:{request.remote_addr}"
+
+
+def _reject(route, reason, retry_after):
+    rejected_total.inc((route, reason))
+    return jsonify({"message": "Too many requests, retry later"}), 429, \
+        {"Retry-After": str(max(1, math.ceil(retry_after)))}
+
+
+def admit():
+    """
+    before_request of the blueprint: the per-user bucket, then the route's bucket
+    and concurrency limit. Each check is a dict lookup or a counter
+    """
+    config = current_app.config
+    if not config["ADMISSION_ENABLED"] or request.method == "OPTIONS":
+        return None
+    route = request.endpoint
+    backend = get_admission_backend()
+    client = _client_key()
+
+    wait = backend.take(client, config["ADMISSION_USER_RATE"], config["ADMISSION_USER_BURST"])
+    if wait:
+        return _reject(route, "user_rate", wait)
+
+    limit = getattr(current_app.view_functions[route], "admission_limit", None)
+    if limit is None:
+        admitted_total.inc((route,))
+        return None
+    if limit.rate:
+        wait = backend.take(f"{client}|{route}", limit.rate, limit.burst)
+        if wait:
+            return _reject(route, "route_rate", wait)
+    if limit.concurrency:
+        concurrency = _concurrency_limit(route, limit.concurrency)
+        if not concurrency.acquire():
+            return _reject(route, "concurrency", config["ADMISSION_BUSY_RETRY_AFTER"])
+        g.admission_slot = concurrency
+    admitted_total.inc((route,))
+    return None
+
+
+_concurrency_lock = Lock()
+
+
+def _concurrency_limit(route, limit):
+    limits = current_app.extensions.setdefault("admission_concurrency", {})
+    concurrency = limits.get(route)
+    if concurrency is None:
+        with _concurrency_lock:
+            concurrency = limits.setdefault(route, ConcurrencyLimit(route, limit))
+    return concurrency
+
+
+def release(exc=None):
+    """
+    teardown_request of the blueprint, after a streamed body is sent
+    """
+    concurrency = g.pop("admission_slot", None)
+    if concurrency:
+        concurrency.release()
@@ -1,21 +1,89 @@
 from flask import Flask
-from flask_migrate import Migrate
+from flask.cli import FlaskGroup
 from models import db
 from routes import main
-from config import Config
+from config import load_config
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
+from validators.cache import identity_cache, membership_cache, idempotency_cache
+from serializers import init_json
+from metrics import init_metrics
+from jobs import init_jobs
+from statuses import get_status_registry
+import click
+import os
 
-app = Flask(__name__)
-CORS(app)
-app.config.from_object(Config)
-jwt = JWTManager(app)
 
-db.init_app(app)
-migrate = Migrate(app, db)
+def create_app(config=None):
+    """
+    Builds the app from the environment (see config.load_config), config overrides single keys
+    (asgi.py swaps the database drivers). Serve it with `gunicorn "app:create_app()"`,
+    `flask --app app` finds the factory by itself
+    """
+    app = Flask(__name__)
+    CORS(app)
+    app.config.from_object(load_config())
+    app.config.update(config or {})
+    init_json(app)
+    JWTManager(app)
+    identity_cache.configure(app.config["IDENTITY_CACHE_SIZE"], app.config["IDENTITY_CACHE_TTL"])
+    membership_cache.configure(app.config["MEMBERSHIP_CACHE_SIZE"], app.config["MEMBERSHIP_CACHE_TTL"])
+    idempotency_cache.configure(app.config["IDEMPOTENCY_CACHE_SIZE"], app.config["IDEMPOTENCY_TTL"])
 
-app.register_blueprint(main)
+    db.init_app(app)
+
+    app.register_blueprint(main)
+    init_metrics(app)
+    init_jobs(app)
+    if under_flask_cli():
+        init_cli(app)
+    elif app.config["WARM_UP"]:
+        warm_up(app)
+    return app
+
+
+def under_flask_cli():
+    #not any click context, uvicorn runs in one too
+    context = click.get_current_context(silent=True)
+    return context is not None and isinstance(context.find_root().command, FlaskGroup)
+
+
+def init_cli(app):
+    """
+    Migrations (alembic) and the maintenance commands, only imported when the app runs under the flask CLI
+    """
+    from flask_migrate import Migrate
+    from commands import rebuild_task_counters_command, run_jobs_command, archive_tasks_command, \
+        purge_idempotency_keys_command
+
+    Migrate(app, db)
+    app.cli.add_command(rebuild_task_counters_command)
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(archive_tasks_command)
+    app.cli.add_command(purge_idempotency_keys_command)
+
+
+def warm_up(app):
+    """
+    Connects every engine and loads the status list before the first request.
+    With a preloading server (gunicorn --preload) this runs before the fork,
+    the children drop the inherited connections and open their own
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            with engine.connect() as connection:
+                connection.exec_driver_sql("SELECT 1")
+        get_status_registry().load()
+        db.session.remove()
+        engines = list(db.engines.values())
+
+    def reset_pools():
+        for engine in engines:
+            engine.dispose(close=False)
+
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=reset_pools)
 
 
 if __name__ == "__main__":
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    create_app().run(debug=True, port=5000)
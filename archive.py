@@ -0,0 +1,54 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from models import db, Task, TaskArchive
+from counters import adjust_task_counters
+from search import get_search_index
+from versioning import bump_project_revision
+
+
+ARCHIVE_COLUMNS = ["id", "name", "description", "creation_date", "statusId", "projectId", "version"]
+
+
+def archive_tasks(cutoff, status_ids, chunk_size, project_id=None, dry_run=False):
+    """
+    Moves tasks created before cutoff in one of status_ids from task to task_archive,
+    a chunk per transaction, and returns how many moved.
+    Counters and search only cover the hot table, archived tasks leave both
+    """
+    conditions = [
+        Task.creation_date < cutoff,
+        Task.statusId.in_(status_ids),
+    ]
+    if project_id is not None:
+        conditions.append(Task.projectId == project_id)
+    if dry_run:
+        return db.session.execute(db.select(db.func.count()).select_from(Task).where(*conditions)).scalar()
+
+    moved, last_id = 0, 0
+    while True:
+        rows = db.session.execute(
+            db.select(Task.id, Task.projectId, Task.statusId)
+            .where(Task.id > last_id, *conditions).order_by(Task.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        task_ids = [row.id for row in rows]
+        db.session.execute(db.insert(TaskArchive).from_select(
+            ARCHIVE_COLUMNS + ["archived_at"],
+            db.select(*[getattr(Task, name) for name in ARCHIVE_COLUMNS], db.literal(datetime.now()))
+            .where(Task.id.in_(task_ids))
+        ))
+        db.session.execute(db.delete(Task).where(Task.id.in_(task_ids)),
+                           execution_options={"synchronize_session": False})
+        get_search_index().remove(task_ids)
+
+        deltas = defaultdict(Counter)
+        for row in rows:
+            deltas[row.projectId][row.statusId] -= 1
+        for archived_project_id, project_deltas in deltas.items():
+            adjust_task_counters(archived_project_id, project_deltas)
+        bump_project_revision(*deltas)
+        db.session.commit()
+        moved += len(task_ids)
+        last_id = task_ids[-1]
+    return moved
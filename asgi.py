@@ -0,0 +1,175 @@
+"""
+Async serving mode: the same app and blueprint on an event loop, run with
+
+    uvicorn asgi:app
+
+The database URIs are switched to SQLAlchemy's asyncio drivers (aiosqlite, aiomysql).
+Every request runs in its own greenlet, the way AsyncSession runs the ORM, so the
+views keep their code and while one waits on the database the worker serves the others
+"""
+from io import BytesIO
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only, greenlet_spawn
+import asyncio
+import sys
+
+from app import create_app, warm_up
+from config import load_config
+from models import db
+
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def async_uri(uri):
+    url = make_url(uri)
+    if url.get_dialect().is_async:
+        return uri
+    if url.get_backend_name() not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}")
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(hide_password=False)
+
+
+def async_engine_options(options):
+    options = dict(options)
+    connect_args = dict(options.get("connect_args", {}))
+    if "connection_timeout" in connect_args: #mysql-connector's name, aiomysql calls it connect_timeout
+        connect_args["connect_timeout"] = connect_args.pop("connection_timeout")
+        options["connect_args"] = connect_args
+    return options
+
+
+def async_config(config):
+    binds = {key: {**async_engine_options(options), "url": async_uri(options["url"])}
+             for key, options in config.SQLALCHEMY_BINDS.items()}
+    return {
+        "SQLALCHEMY_DATABASE_URI": async_uri(config.SQLALCHEMY_DATABASE_URI),
+        "SQLALCHEMY_ENGINE_OPTIONS": async_engine_options(config.SQLALCHEMY_ENGINE_OPTIONS),
+        "SQLALCHEMY_BINDS": binds,
+        #job threads would need their own event loop, run them with `flask run-jobs` next to this
+        "JOBS_WORKERS": 0,
+        #the async drivers connect on the event loop, lifespan startup warms up instead
+        "WARM_UP": False,
+    }
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name in ("CONTENT_LENGTH", "TRANSFER_ENCODING"): #the body is already read whole, set below
+            continue
+        if name != "CONTENT_TYPE":
+            name = "HTTP_" + name
+        environ[name] = environ[name] + "," + value if name in environ else value
+    environ["CONTENT_LENGTH"] = str(len(body))
+    return environ
+
+
+class AsgiApp:
+    """
+    Minimal ASGI to WSGI bridge, the response body is sent chunk by chunk so the NDJSON export still streams
+    """
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        state = {"disconnected": False}
+        watcher = asyncio.ensure_future(self.watch_disconnect(receive, state))
+        try:
+            await greenlet_spawn(self.handle, wsgi_environ(scope, bytes(body)), send, state)
+        finally:
+            watcher.cancel()
+
+    @staticmethod
+    async def watch_disconnect(receive, state):
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        state["disconnected"] = True
+
+    def handle(self, environ, send, state):
+        #runs inside greenlet_spawn, so the async drivers and await_only(send(...)) work from sync code
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(name.lower().encode("latin1"), value.encode("latin1")) for name, value in headers]
+
+        response = self.wsgi_app(environ, start_response)
+        try:
+            await_only(send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]}))
+            for chunk in response:
+                if state["disconnected"]: #ends event streams of clients that left
+                    return
+                if chunk:
+                    await_only(send({"type": "http.response.body", "body": chunk, "more_body": True}))
+            await_only(send({"type": "http.response.body", "body": b""}))
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if settings.WARM_UP:
+                    await greenlet_spawn(warm_up, flask_app)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                with flask_app.app_context():
+                    for engine in db.engines.values():
+                        await greenlet_spawn(engine.dispose)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+background_tasks = set()
+
+
+def spawn_background(target):
+    """
+    Runs target in its own greenlet on the event loop, threads can't use the async drivers
+    """
+    task = asyncio.get_running_loop().create_task(greenlet_spawn(target))
+    background_tasks.add(task) #the loop only keeps weak references to tasks
+    task.add_done_callback(background_tasks.discard)
+
+
+settings = load_config()
+flask_app = create_app(async_config(settings))
+flask_app.extensions["spawn_background"] = spawn_background
+app = AsgiApp(flask_app.wsgi_app)
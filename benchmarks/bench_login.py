@@ -0,0 +1,110 @@
+"""
+Login throughput at different password hash costs.
+
+For every cost the bench user's password is rehashed, then POST /login is driven
+from 1, 4, ... threads. Successful logins per second and latency are reported
+next to the 503s returned once the hashing pool and its queue are full.
+
+    python -m benchmarks.bench_login --costs 1000,100000,600000 --concurrency 1,4,16
+    python -m benchmarks.bench_login --workers 2 --queue 4 --concurrency 32
+
+Run it from the project root, the config still needs .env (or the same keys in the environment).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import time
+
+from models import db, User
+from passwords import get_password_hasher
+from benchmarks.common import BENCH_USER, BENCH_PASSWORD, make_app, seed, percentile
+from werkzeug.security import generate_password_hash
+
+
+def set_password(app, password):
+    with app.app_context():
+        db.session.execute(db.update(User).where(User.name == BENCH_USER).values(password=password))
+        db.session.commit()
+
+
+def run(app, requests, concurrency):
+    def worker(_):
+        client = app.test_client()
+        latencies, busy, errors = [], 0, 0
+        for _ in range(requests):
+            begin = time.perf_counter()
+            response = client.post("/login", json={"username": BENCH_USER, "password": BENCH_PASSWORD})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - begin)
+            elif response.status_code == 503:
+                busy += 1
+            else:
+                errors += 1
+        return latencies, busy, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+    latencies = [l for r in results for l in r[0]]
+    return {
+        "logins": len(latencies),
+        "busy": sum(r[1] for r in results),
+        "errors": sum(r[2] for r in results),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+def bench_cost(cost, args):
+    method = f"pbkdf2:sha256:{cost}"
+    app = make_app(os.path.join(args.db_dir, "bench_login.db"), PASSWORD_HASH_METHOD=method,
+                   PASSWORD_HASH_WORKERS=args.workers, PASSWORD_HASH_QUEUE=args.queue)
+    seed(app, 0)
+
+    #a legacy plaintext row is upgraded by its first login
+    set_password(app, BENCH_PASSWORD)
+    client = app.test_client()
+    begin = time.perf_counter()
+    client.post("/login", json={"username": BENCH_USER, "password": BENCH_PASSWORD})
+    rehash_ms = (time.perf_counter() - begin) * 1000
+    with app.app_context():
+        stored = db.session.execute(db.select(User.password).filter_by(name=BENCH_USER)).scalar()
+    print(f"{cost:>8} plaintext login + rehash {rehash_ms:.1f}ms, stored as {stored.split('$', 1)[0]}")
+
+    set_password(app, generate_password_hash(BENCH_PASSWORD, method))
+    results = {}
+    for concurrency in args.concurrency:
+        result = results[f"x{concurrency}"] = run(app, max(1, args.requests // concurrency), concurrency)
+        print(f"{cost:>8} x{concurrency:<3} {result['rps']:>8.1f} logins/s p50 {result['p50_ms']:>9.3f}ms "
+              f"p99 {result['p99_ms']:>9.3f}ms {result['busy']} busy {result['errors']} err")
+
+    with app.app_context():
+        get_password_hasher().shutdown()
+        db.engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--costs", default="1000,100000,600000", help="comma separated pbkdf2 iteration counts")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma separated thread counts")
+    parser.add_argument("--requests", type=int, default=64, help="logins per cost and concurrency")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument("--queue", type=int, default=32, help="PASSWORD_HASH_QUEUE")
+    parser.add_argument("--db-dir", default=".bench", help="where the seeded database is kept")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+    args.concurrency = [int(value) for value in args.concurrency.split(",")]
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    results = {cost: bench_cost(int(cost), args) for cost in args.costs.split(",")}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""
+Route-level benchmark for every endpoint of the main blueprint.
+
+Seeds a SQLite database per size (kept in --db-dir and reused between runs),
+drives each route through the Flask test client and reports p50/p95/p99 latency,
+throughput and SQL statements per request. --concurrency N also runs the read
+routes from N threads at once.
+
+    python -m benchmarks.bench_routes --sizes 1000,100000,1000000
+    python -m benchmarks.bench_routes --sizes 1000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench_routes --sizes 1000 --baseline benchmarks/baseline.json
+
+Run it from the project root, the config still needs .env (or the same keys in the environment).
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sys
+import time
+
+from models import db
+from benchmarks.common import (BENCH_USER, BENCH_PASSWORD, PROJECTS, make_app, seed,
+                               QueryCounter, percentile)
+from flask_jwt_extended import create_access_token
+
+
+class Context:
+    def __init__(self, app, tasks):
+        self.run = str(int(time.time() * 1000))
+        self.tasks = tasks
+        with app.app_context():
+            self.headers = {"Authorization": "Bearer " + create_access_token(identity=BENCH_USER)}
+        self.project_id = 1
+        #seeded tasks of project p have ids p, p + PROJECTS, p + 2 * PROJECTS...
+        self.project_tasks = max(1, tasks // PROJECTS)
+        self.created_tasks = []
+        self.created_projects = []
+        self.etag = None
+        self.job_id = None
+
+    def task_id(self, i):
+        return self.project_id + (i * 7919 % self.project_tasks) * PROJECTS
+
+
+def created_json(response):
+    return response.get_json(silent=True) or {}
+
+
+#name -> (view function, read only, request builder, hook called with the response)
+SCENARIOS = {
+    "POST /register": ("register", False, lambda ctx, i: ("post", "/register", {"username": f"u{ctx.run}-{i}", "password": "p"}), None),
+    "POST /register/batch": ("register_batch", False, lambda ctx, i: ("post", "/register/batch", {"users": [
+        {"username": f"b{ctx.run}-{i}-{j}", "password": "p"} for j in range(20)]}), None),
+    "POST /login": ("login", False, lambda ctx, i: ("post", "/login", {"username": BENCH_USER, "password": BENCH_PASSWORD}), None),
+    "POST /projects": ("create_project", False, lambda ctx, i: ("post", "/projects", {"project_name": f"p{ctx.run}-{i}"}),
+                       lambda ctx, r: ctx.created_projects.append(created_json(r).get("project", {}).get("id"))),
+    "POST /projects/<id>/tasks": ("create_task", False, lambda ctx, i: ("post", f"/projects/{ctx.project_id}/tasks",
+                                                         {"task_name": f"bench {i}", "description": "created by the benchmark"}),
+                                  lambda ctx, r: ctx.created_tasks.append(created_json(r).get("task", {}).get("id"))),
+    "POST /projects/<id>/tasks/batch": ("batch_tasks", False, lambda ctx, i: ("post", f"/projects/{ctx.project_id}/tasks/batch", {"operations":
+        [{"op": "create", "task_name": f"batch {i}-{j}", "description": "batch"} for j in range(10)] +
+        [{"op": "update", "id": ctx.task_id(i * 5 + j), "status": j % 4 + 1} for j in range(5)]}), None),
+    "POST /projects/<id>/jobs": ("create_job", False, lambda ctx, i: ("post", f"/projects/{ctx.project_id}/jobs", {"kind": "export"}),
+                                 lambda ctx, r: setattr(ctx, "job_id", created_json(r).get("job", {}).get("id"))),
+    "GET /jobs/<id>": ("job_by_id", True, lambda ctx, i: ("get", f"/jobs/{ctx.job_id}", None), None),
+    "GET /projects": ("all_projects", True, lambda ctx, i: ("get", "/projects", None), None),
+    "GET /projects/<id>": ("project_by_id", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}", None), None),
+    "GET /projects/<id>/tasks": ("all_tasks_in_project", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/tasks", None),
+                                 lambda ctx, r: setattr(ctx, "etag", r.headers.get("ETag"))),
+    "GET /projects/<id>/tasks (304)": ("all_tasks_in_project", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/tasks",
+                                                             {"headers": {"If-None-Match": ctx.etag or ""}}), None),
+    "GET /projects/<id>/tasks?cursor": ("all_tasks_in_project", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/tasks?cursor={ctx.task_id(i)}", None), None),
+    "GET /projects/<id>/tasks?status": ("all_tasks_in_project", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/tasks?status={i % 4 + 1}", None), None),
+    "GET /projects/<id>/summary": ("project_summary", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/summary", None), None),
+    "GET /projects/<id>/tasks/export": ("export_tasks", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/tasks/export", None), None),
+    "GET /statuses": ("all_statuses", True, lambda ctx, i: ("get", "/statuses", None), None),
+    "GET /statuses/<id>": ("status_by_id", True, lambda ctx, i: ("get", f"/statuses/{i % 4 + 1}", None), None),
+    "GET /search": ("search_tasks", True, lambda ctx, i: ("get", "/search?q=login%20crash&per_page=20", None), None),
+    "GET /projects/<id>/tasks/<task_id>": ("task_by_id", True, lambda ctx, i: ("get", f"/projects/{ctx.project_id}/tasks/{ctx.task_id(i)}", None), None),
+    "PUT /projects/<id>": ("update_project_data", False, lambda ctx, i: ("put", f"/projects/{ctx.created_projects[i % len(ctx.created_projects)]}",
+                                                  {"name": f"renamed {ctx.run}-{i}"}), None),
+    "PUT /projects/<id>/tasks/<task_id>": ("update_task_data", False, lambda ctx, i: ("put", f"/projects/{ctx.project_id}/tasks/{ctx.task_id(i)}",
+                                                                  {"status": i % 4 + 1, "name": f"updated {i}"}), None),
+    "PATCH /projects/<id>/tasks/<task_id>": ("update_task_data", False, lambda ctx, i: ("patch", f"/projects/{ctx.project_id}/tasks/{ctx.task_id(i)}",
+                                                                    {"name": f"patched {i}"}), None),
+    "DELETE /projects/<id>/tasks/<task_id>": ("delete_task", False, lambda ctx, i: ("delete", f"/projects/{ctx.project_id}/tasks/{ctx.created_tasks[i % len(ctx.created_tasks)]}", None), None),
+    "DELETE /projects/<id>": ("leave_project", False, lambda ctx, i: ("delete", f"/projects/{ctx.created_projects[i % len(ctx.created_projects)]}", None), None),
+}
+
+#endpoints that are not implemented yet, the event stream which never ends,
+#and export downloads which need the job workers (make_app doesn't start them)
+SKIPPED_ENDPOINTS = {"main.connect_to_project", "main.project_events", "main.job_file"}
+
+#routes whose cost grows with the project, fewer requests keep the run short
+SLOW_SCENARIOS = {"GET /projects/<id>/tasks/export"}
+
+
+def send(client, ctx, builder, i):
+    method, url, payload = builder(ctx, i)
+    kwargs = {"headers": dict(ctx.headers)}
+    if payload and "headers" in payload:
+        kwargs["headers"].update(payload["headers"])
+    elif payload is not None:
+        kwargs["json"] = payload
+    response = getattr(client, method)(url, **kwargs)
+    response.get_data() #drain streamed responses
+    return response
+
+
+def summarize(latencies, queries, wall, errors):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "queries": round(sum(queries) / len(queries), 2) if queries else 0.0,
+    }
+
+
+def run_sequential(app, ctx, counter, name, requests):
+    _, _, builder, hook = SCENARIOS[name]
+    client = app.test_client()
+    latencies, queries, errors = [], [], 0
+    started = time.perf_counter()
+    for i in range(requests):
+        counter.reset()
+        begin = time.perf_counter()
+        response = send(client, ctx, builder, i)
+        latencies.append(time.perf_counter() - begin)
+        queries.append(counter.count)
+        if response.status_code >= 400:
+            errors += 1
+        if hook:
+            hook(ctx, response)
+    return summarize(latencies, queries, time.perf_counter() - started, errors)
+
+
+def run_concurrent(app, ctx, counter, name, requests, concurrency):
+    _, _, builder, hook = SCENARIOS[name]
+
+    def worker(worker_id):
+        client = app.test_client()
+        latencies, queries, errors = [], [], 0
+        for i in range(requests):
+            counter.reset()
+            begin = time.perf_counter()
+            response = send(client, ctx, builder, worker_id * requests + i)
+            latencies.append(time.perf_counter() - begin)
+            queries.append(counter.count)
+            errors += response.status_code >= 400
+            if hook:
+                hook(ctx, response)
+        return latencies, queries, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+    return summarize([l for r in results for l in r[0]], [q for r in results for q in r[1]], wall, sum(r[2] for r in results))
+
+
+def bench_size(size, args):
+    db_path = os.path.join(args.db_dir, f"bench_{size}.db")
+    app = make_app(db_path)
+    print(f"seeding {size} tasks into {db_path}...", file=sys.stderr)
+    seed(app, size)
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.startswith("main.")}
+    covered = {"main." + scenario[0] for scenario in SCENARIOS.values()}
+    for endpoint in sorted(endpoints - covered - SKIPPED_ENDPOINTS):
+        print(f"warning: no benchmark scenario for {endpoint}", file=sys.stderr)
+
+    #requests must push their own app context, so nothing below runs inside one
+    counter = QueryCounter()
+    with app.app_context():
+        counter.install(db.engine)
+    ctx = Context(app, size)
+    selected = [name for name in SCENARIOS if not args.only or any(part in name for part in args.only)]
+
+    results = {}
+    for name in selected:
+        requests = min(args.requests, args.slow_requests) if name in SLOW_SCENARIOS else args.requests
+        results[name] = run_sequential(app, ctx, counter, name, requests)
+        print_row(size, "seq", name, results[name])
+    if args.concurrency > 1:
+        for name in selected:
+            if not SCENARIOS[name][1] or name in SLOW_SCENARIOS:
+                continue #SQLite serializes writers, the load mode only drives reads
+            key = f"{name} [x{args.concurrency}]"
+            results[key] = run_concurrent(app, ctx, counter, name, args.requests, args.concurrency)
+            print_row(size, f"x{args.concurrency}", name, results[key])
+
+    with app.app_context():
+        db.engine.dispose()
+    return results
+
+
+def print_row(size, mode, name, result):
+    print(f"{size:>8} {mode:>4} {name:<40} p50 {result['p50_ms']:>9.3f}ms p95 {result['p95_ms']:>9.3f}ms "
+          f"p99 {result['p99_ms']:>9.3f}ms {result['rps']:>8.1f} req/s {result['queries']:>6.2f} q/req "
+          f"{result['errors']} err")
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for size, routes in results.items():
+        for name, result in routes.items():
+            base = baseline.get(size, {}).get(name)
+            if not base:
+                continue
+            if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{size} {name}: p95 {base['p95_ms']}ms -> {result['p95_ms']}ms")
+            if result["queries"] > base["queries"]:
+                regressions.append(f"{size} {name}: queries {base['queries']} -> {result['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000", help="comma separated task counts, e.g. 1000,100000,1000000")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route (per thread with --concurrency)")
+    parser.add_argument("--slow-requests", type=int, default=5, help="requests for routes that read whole projects")
+    parser.add_argument("--concurrency", type=int, default=1, help="threads for the concurrent load mode")
+    parser.add_argument("--only", action="append", help="run only routes whose name contains this, repeatable")
+    parser.add_argument("--db-dir", default=".bench", help="where the seeded databases are kept")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="compare with this results file")
+    parser.add_argument("--save-baseline", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    results = {size: bench_size(int(size), args) for size in args.sizes.split(",")}
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
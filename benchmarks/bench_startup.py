@@ -0,0 +1,117 @@
+"""
+Cold start of a worker process: importing app.py, create_app() and the first requests.
+
+Every run is a fresh interpreter, started once with WARM_UP=0 and once with WARM_UP=1,
+and reports the p50 of each phase. --imports lists the modules slowest to import
+(python -X importtime), the place to look when the import phase grows.
+
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --imports 15
+
+Run it from the project root, the config still needs .env (or the same keys in the environment).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+PHASES = ["import_ms", "create_app_ms", "first_request_ms", "second_request_ms", "first_response_ms"]
+
+
+def child():
+    #runs in the fresh interpreter, nothing of the app is imported before this point
+    started = time.perf_counter()
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter()
+
+    from flask_jwt_extended import create_access_token
+    from benchmarks.common import BENCH_USER
+    with app.app_context():
+        headers = {"Authorization": "Bearer " + create_access_token(identity=BENCH_USER)}
+    client = app.test_client()
+    requested = time.perf_counter()
+    first = client.get("/projects/1/tasks?limit=20", headers=headers)
+    first_done = time.perf_counter()
+    client.get("/projects/1/tasks?limit=20", headers=headers)
+    second_done = time.perf_counter()
+    if first.status_code != 200:
+        raise SystemExit(f"GET /projects/1/tasks answered {first.status_code}")
+
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "create_app_ms": (created - imported) * 1000,
+        "first_request_ms": (first_done - requested) * 1000,
+        "second_request_ms": (second_done - first_done) * 1000,
+        "first_response_ms": (first_done - started - (requested - created)) * 1000,
+    }))
+
+
+def run_child(db_path, warm_up):
+    env = dict(os.environ,
+               SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.abspath(db_path)}",
+               SQLALCHEMY_REPLICA_URI="",
+               WARM_UP="1" if warm_up else "0",
+               JOBS_WORKERS="0",
+               ADMISSION_ENABLED="0")
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child"],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(count):
+    """
+    (cumulative ms, module) of the slowest imports of app.py
+    """
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                            capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative) / 1000, name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--tasks", type=int, default=10000, help="tasks in the seeded database")
+    parser.add_argument("--imports", type=int, default=0, help="also list the N slowest imports")
+    parser.add_argument("--db-dir", default=".bench", help="where the seeded database is kept")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    from benchmarks.common import make_app, seed, percentile
+    os.makedirs(args.db_dir, exist_ok=True)
+    db_path = os.path.join(args.db_dir, f"bench_startup_{args.tasks}.db")
+    seed(make_app(db_path), args.tasks)
+
+    results = {}
+    for mode, warm_up in (("cold", False), ("warm_up", True)):
+        runs = [run_child(db_path, warm_up) for _ in range(args.runs)]
+        result = results[mode] = {phase: round(percentile([run[phase] for run in runs], 0.50), 3) for phase in PHASES}
+        print(f"{mode:>8} import {result['import_ms']:>8.1f}ms create_app {result['create_app_ms']:>7.1f}ms "
+              f"first request {result['first_request_ms']:>7.1f}ms second {result['second_request_ms']:>6.1f}ms "
+              f"start to first response {result['first_response_ms']:>8.1f}ms")
+
+    if args.imports:
+        results["slowest_imports"] = slowest_imports(args.imports)
+        for cumulative, name in results["slowest_imports"]:
+            print(f"{cumulative:>10.1f}ms {name}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Helpers shared by the benchmarks: an app bound to a scratch SQLite file,
+seeding and SQL statement counting
+"""
+from datetime import datetime, timedelta
+from threading import local
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, text
+from werkzeug.security import generate_password_hash
+import math
+import os
+import time
+
+from app import create_app
+from models import db, Project, ProjectRole, User, StatusList, Task
+from counters import rebuild_task_counters
+from validators.cache import identity_cache, membership_cache
+
+
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench-password"
+PROJECTS = 10
+#route benchmarks measure queries, a cheap hash keeps /register and /login comparable, bench_login measures the cost
+BENCH_HASH_METHOD = "pbkdf2:sha256:1000"
+STATUSES = ["todo", "in progress", "review", "done"]
+
+
+def make_app(db_path, **config):
+    """
+    The app from create_app on a scratch SQLite file, without the replica and the job workers
+    """
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.abspath(db_path)}",
+        "SQLALCHEMY_ENGINE_OPTIONS": {"connect_args": {"timeout": 30}},
+        "SQLALCHEMY_BINDS": {},
+        "PASSWORD_HASH_METHOD": BENCH_HASH_METHOD,
+        "ADMISSION_ENABLED": False, #a benchmark client is exactly what admission control throttles
+        "JOBS_WORKERS": 0,
+        "WARM_UP": False,
+        **config,
+    })
+    identity_cache.clear()
+    membership_cache.clear()
+    return app
+
+
+def seed(app, tasks, chunk=50000):
+    """
+    Fills an empty database: one bench user owning PROJECTS projects,
+    the tasks spread evenly between them, plus counters and the search index
+    """
+    with app.app_context():
+        db.create_all()
+        if db.session.execute(db.select(User.id).filter_by(name=BENCH_USER)).first():
+            return
+        db.session.add_all(StatusList(id=i + 1, statusName=name, description=name) for i, name in enumerate(STATUSES))
+        password = generate_password_hash(BENCH_PASSWORD, app.config["PASSWORD_HASH_METHOD"])
+        user = User(name=BENCH_USER, password=password, token=create_access_token(identity=BENCH_USER))
+        db.session.add(user)
+        db.session.flush()
+        for project_id in range(1, PROJECTS + 1):
+            db.session.add(Project(id=project_id, name=f"bench project {project_id}"))
+            db.session.flush()
+            db.session.add(ProjectRole(userId=user.id, projectId=project_id, role="owner"))
+
+        start = datetime(2024, 1, 1)
+        words = ["login", "page", "crash", "docs", "deploy", "api", "cache", "index", "report", "mobile"]
+        for offset in range(0, tasks, chunk):
+            rows = [{
+                "name": f"{words[i % 10]} {words[(i // 10) % 10]} task {i}",
+                "description": f"{words[(i // 100) % 10]} {words[(i * 7) % 10]} description {i}",
+                "creation_date": start + timedelta(minutes=i),
+                "statusId": i % len(STATUSES) + 1,
+                "projectId": i % PROJECTS + 1,
+            } for i in range(offset, min(offset + chunk, tasks))]
+            db.session.execute(db.insert(Task), rows)
+        db.session.commit()
+
+        rebuild_task_counters()
+        if app.config.get("SEARCH_BACKEND", "auto") in ("auto", "fts5"):
+            db.session.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5(name, description, projectId UNINDEXED)"))
+            db.session.execute(text("INSERT INTO task_fts(rowid, name, description, projectId) SELECT id, name, description, projectId FROM task"))
+            db.session.commit()
+
+
+class QueryCounter:
+    """
+    Counts SQL statements per thread, for the engines of the app
+    """
+    def __init__(self):
+        self._local = local()
+
+    def install(self, engine):
+        event.listen(engine, "before_cursor_execute", self._before)
+
+    def _before(self, *args):
+        self._local.count = getattr(self._local, "count", 0) + 1
+
+    def reset(self):
+        self._local.count = 0
+
+    @property
+    def count(self):
+        return getattr(self._local, "count", 0)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
@@ -0,0 +1,67 @@
+import click
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import with_appcontext
+from counters import rebuild_task_counters
+from archive import archive_tasks
+from idempotency import purge_idempotency_keys
+from statuses import get_status_registry
+from jobs import JobRunner
+
+
+@click.command("rebuild-task-counters")
+@click.option("--project-id", type=int, default=None, help="Only this project, all projects by default.")
+@with_appcontext
+def rebuild_task_counters_command(project_id):
+    """Recomputes task_status_counter from the task table."""
+    rebuild_task_counters(project_id)
+    click.echo("Task counters rebuilt" + (f" for project {project_id}" if project_id is not None else ""))
+
+
+@click.command("run-jobs")
+@click.option("--workers", type=int, default=None, help="Worker threads, JOBS_WORKERS by default.")
+@with_appcontext
+def run_jobs_command(workers):
+    """Runs background jobs until interrupted, for deployments with JOBS_WORKERS=0 in the web processes."""
+    app = current_app._get_current_object()
+    runner = JobRunner(app, workers or app.config["JOBS_WORKERS"] or 1, app.config["JOBS_POLL_INTERVAL"])
+    runner.start()
+    click.echo(f"Running jobs with {runner.workers} workers, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        runner.stop()
+
+
+@click.command("archive-tasks")
+@click.option("--older-than-days", type=int, default=None, help="ARCHIVE_AFTER_DAYS by default.")
+@click.option("--status", "statuses", multiple=True, help="Terminal status name, repeatable, ARCHIVE_STATUSES by default.")
+@click.option("--project-id", type=int, default=None, help="Only this project, all projects by default.")
+@click.option("--chunk-size", type=int, default=None, help="Tasks per transaction, ARCHIVE_CHUNK_SIZE by default.")
+@click.option("--dry-run", is_flag=True, help="Only count the tasks that would move.")
+@with_appcontext
+def archive_tasks_command(older_than_days, statuses, project_id, chunk_size, dry_run):
+    """Moves old tasks in terminal statuses from task to task_archive."""
+    config = current_app.config
+    days = older_than_days if older_than_days is not None else config["ARCHIVE_AFTER_DAYS"]
+    names = list(statuses) or [name.strip() for name in config["ARCHIVE_STATUSES"].split(",") if name.strip()]
+    status_ids = {name: get_status_registry().resolve(name) for name in names}
+    unknown = [name for name, status_id in status_ids.items() if status_id is None]
+    if unknown:
+        raise click.ClickException(f"Unknown statuses: {', '.join(unknown)}")
+
+    cutoff = datetime.now() - timedelta(days=days)
+    count = archive_tasks(cutoff, list(status_ids.values()), chunk_size or config["ARCHIVE_CHUNK_SIZE"],
+                          project_id, dry_run)
+    click.echo(f"{count} tasks created before {cutoff:%Y-%m-%d} in {', '.join(names)} "
+               + ("would be archived" if dry_run else "archived"))
+
+
+@click.command("purge-idempotency-keys")
+@with_appcontext
+def purge_idempotency_keys_command():
+    """Deletes Idempotency-Keys older than IDEMPOTENCY_TTL, run it from cron."""
+    cutoff = datetime.now() - timedelta(seconds=current_app.config["IDEMPOTENCY_TTL"])
+    click.echo(f"{purge_idempotency_keys(cutoff)} idempotency keys deleted")
@@ -1,8 +1,140 @@
 from dotenv import dotenv_values
+import os
 
-data = dotenv_values(".env")
 
-class Config:
-    SQLALCHEMY_DATABASE_URI = data["SQLALCHEMY_DATABASE_URI"]
-    SECRET_KEY = data["SECRET_KEY"] 
-    JWT_SECRET_KEY = data["JWT_SECRET_KEY"]
\ No newline at end of file
+def load_env(env_file=None):
+    """
+    The .env file (APP_ENV_FILE names another one) with the process environment on top,
+    so containers can set single keys without a file
+    """
+    return {**dotenv_values(env_file or os.environ.get("APP_ENV_FILE", ".env")), **os.environ}
+
+
+def engine_options(data):
+    """
+    Pool settings from .env, only the ones that are set so the dialect defaults stay otherwise
+    """
+    options = {}
+    for key, option, cast in (("DB_POOL_SIZE", "pool_size", int),
+                              ("DB_MAX_OVERFLOW", "max_overflow", int),
+                              ("DB_POOL_RECYCLE", "pool_recycle", int),
+                              ("DB_POOL_TIMEOUT", "pool_timeout", int),
+                              ("DB_POOL_PRE_PING", "pool_pre_ping", lambda value: value == "1")):
+        if data.get(key):
+            options[option] = cast(data[key])
+    if data.get("DB_CONNECT_TIMEOUT"):
+        #mysql-connector and sqlite3 name the connect timeout differently
+        name = "timeout" if data["SQLALCHEMY_DATABASE_URI"].startswith("sqlite") else "connection_timeout"
+        options["connect_args"] = {name: int(data["DB_CONNECT_TIMEOUT"])}
+    return options
+
+
+def load_config(data=None):
+    """
+    Reads the settings when an app is created instead of on import, returns the class for app.config.from_object
+    """
+    data = load_env() if data is None else data
+
+    class Config:
+        SQLALCHEMY_DATABASE_URI = data["SQLALCHEMY_DATABASE_URI"]
+        SECRET_KEY = data["SECRET_KEY"] 
+        JWT_SECRET_KEY = data["JWT_SECRET_KEY"]
+        #seconds an access token stays valid once verify_jwt_in_request checks it, 0 for tokens that never expire
+        JWT_ACCESS_TOKEN_EXPIRES = int(data.get("JWT_ACCESS_TOKEN_EXPIRES", 900)) or False
+
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(data)
+        #optional read replica, used by the views marked @read_only
+        SQLALCHEMY_BINDS = {
+            "replica": {"url": data["SQLALCHEMY_REPLICA_URI"], **SQLALCHEMY_ENGINE_OPTIONS}
+        } if data.get("SQLALCHEMY_REPLICA_URI") else {}
+
+        #username -> user id cache used by jwt_token_required
+        IDENTITY_CACHE_SIZE = int(data.get("IDENTITY_CACHE_SIZE", 10000))
+        IDENTITY_CACHE_TTL = int(data.get("IDENTITY_CACHE_TTL", 300))
+
+        #(user, project) -> role cache used by project_role_required, TTL bounds staleness between workers
+        MEMBERSHIP_CACHE_SIZE = int(data.get("MEMBERSHIP_CACHE_SIZE", 50000))
+        MEMBERSHIP_CACHE_TTL = int(data.get("MEMBERSHIP_CACHE_TTL", 60))
+
+        #GET /projects/<id>/tasks pagination
+        TASKS_PAGE_SIZE = int(data.get("TASKS_PAGE_SIZE", 100))
+        TASKS_PAGE_SIZE_MAX = int(data.get("TASKS_PAGE_SIZE_MAX", 500))
+
+        #rows per fetch for the NDJSON export
+        EXPORT_CHUNK_SIZE = int(data.get("EXPORT_CHUNK_SIZE", 1000))
+
+        #max operations in one POST /projects/<id>/tasks/batch
+        TASKS_BATCH_MAX = int(data.get("TASKS_BATCH_MAX", 1000))
+        #max users in one POST /register/batch, every one of them is a slow password hash
+        REGISTER_BATCH_MAX = int(data.get("REGISTER_BATCH_MAX", 100))
+
+        #"orjson" to encode responses with orjson when it is installed, "default" for the stdlib
+        JSON_ENCODER = data.get("JSON_ENCODER", "orjson")
+
+        #"auto" uses SQLite FTS5 on SQLite and the in-process index elsewhere, or force "fts5" / "memory"
+        SEARCH_BACKEND = data.get("SEARCH_BACKEND", "auto")
+        #seconds before the in-process index is rebuilt in the background to pick up other workers' writes
+        SEARCH_INDEX_MAX_AGE = int(data.get("SEARCH_INDEX_MAX_AGE", 60))
+
+        #requests slower than this are logged with their SQL statements, 0 turns it off
+        SLOW_REQUEST_THRESHOLD_MS = int(data.get("SLOW_REQUEST_THRESHOLD_MS", 500))
+        METRICS_ENABLED = data.get("METRICS_ENABLED", "1") == "1"
+
+        #what @query_budget does when a view runs too many statements: "raise", "warn", "off",
+        #or "auto" to raise under app.testing and warn under app.debug
+        QUERY_BUDGET_MODE = data.get("QUERY_BUDGET_MODE", "auto")
+
+        #werkzeug hash method with its cost, stored hashes made with another one are upgraded on login
+        PASSWORD_HASH_METHOD = data.get("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+        #hashing threads and how many hashes may wait for one, past that /login and /register answer 503
+        PASSWORD_HASH_WORKERS = int(data.get("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+        PASSWORD_HASH_QUEUE = int(data.get("PASSWORD_HASH_QUEUE", 32))
+        PASSWORD_HASH_RETRY_AFTER = int(data.get("PASSWORD_HASH_RETRY_AFTER", 1))
+
+        #GET /projects/<id>/events: events kept per project for Last-Event-ID resumes,
+        #events a slow client may fall behind before its stream is closed, seconds between keepalives
+        EVENTS_BUFFER_SIZE = int(data.get("EVENTS_BUFFER_SIZE", 1000))
+        EVENTS_SUBSCRIBER_QUEUE = int(data.get("EVENTS_SUBSCRIBER_QUEUE", 1000))
+        EVENTS_KEEPALIVE = int(data.get("EVENTS_KEEPALIVE", 15))
+
+        #background jobs: worker threads per web process (0 to run them only with `flask run-jobs`),
+        #seconds between polls for jobs queued by other processes, rows per transaction,
+        #seconds without progress before a running job is taken over, attempts (failures and takeovers) before it fails
+        JOBS_WORKERS = int(data.get("JOBS_WORKERS", 2))
+        JOBS_POLL_INTERVAL = int(data.get("JOBS_POLL_INTERVAL", 5))
+        JOBS_CHUNK_SIZE = int(data.get("JOBS_CHUNK_SIZE", 1000))
+        JOBS_STALE_AFTER = int(data.get("JOBS_STALE_AFTER", 300))
+        JOBS_MAX_ATTEMPTS = int(data.get("JOBS_MAX_ATTEMPTS", 3))
+        JOBS_EXPORT_DIR = data.get("JOBS_EXPORT_DIR", "exports")
+
+        #flask archive-tasks: age in days and comma separated status names of the tasks it moves to task_archive
+        ARCHIVE_AFTER_DAYS = int(data.get("ARCHIVE_AFTER_DAYS", 180))
+        ARCHIVE_STATUSES = data.get("ARCHIVE_STATUSES", "done")
+        ARCHIVE_CHUNK_SIZE = int(data.get("ARCHIVE_CHUNK_SIZE", 1000))
+
+        #seconds between checks of status_list_version, a changed status list is picked up within this
+        STATUS_CHECK_INTERVAL = int(data.get("STATUS_CHECK_INTERVAL", 30))
+
+        #admission control in front of the blueprint: requests per second and burst of every client
+        #(JWT identity, or address), "memory" buckets per worker process or "package.module:Class"
+        #of a shared backend, buckets kept in memory, Retry-After of routes at their concurrency limit
+        ADMISSION_ENABLED = data.get("ADMISSION_ENABLED", "1") == "1"
+        ADMISSION_USER_RATE = float(data.get("ADMISSION_USER_RATE", 20))
+        ADMISSION_USER_BURST = float(data.get("ADMISSION_USER_BURST", 40))
+        ADMISSION_BACKEND = data.get("ADMISSION_BACKEND", "memory")
+        ADMISSION_MAX_KEYS = int(data.get("ADMISSION_MAX_KEYS", 100000))
+        ADMISSION_BUSY_RETRY_AFTER = int(data.get("ADMISSION_BUSY_RETRY_AFTER", 1))
+
+        #opens the database connections and loads the status list when the app is created,
+        #so a new worker doesn't make its first requests pay for it
+        WARM_UP = data.get("WARM_UP", "0") == "1"
+
+        #Idempotency-Key of POST /projects and POST /projects/<id>/tasks: seconds a response is replayed,
+        #responses kept in memory in front of the table, seconds before the key of a request that never
+        #finished is free again (also how long a duplicate waits for it), Retry-After of the 409
+        IDEMPOTENCY_TTL = int(data.get("IDEMPOTENCY_TTL", 86400))
+        IDEMPOTENCY_CACHE_SIZE = int(data.get("IDEMPOTENCY_CACHE_SIZE", 10000))
+        IDEMPOTENCY_LOCK_TIMEOUT = int(data.get("IDEMPOTENCY_LOCK_TIMEOUT", 60))
+        IDEMPOTENCY_RETRY_AFTER = int(data.get("IDEMPOTENCY_RETRY_AFTER", 1))
+
+    return Config
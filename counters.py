@@ -0,0 +1,87 @@
+from collections import Counter
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from models import db, Task, TaskStatusCounter
+
+
+def _increment_counter(project_id, status_id, delta):
+    return db.session.execute(
+        db.update(TaskStatusCounter)
+        .where(TaskStatusCounter.projectId == project_id, TaskStatusCounter.statusId == status_id)
+        .values(count=TaskStatusCounter.count + delta)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def adjust_task_counters(project_id, deltas):
+    """
+    Applies {statusId: delta} to the counters of the project.
+    Call it in the same transaction as the task write
+    """
+    rows = [{"projectId": project_id, "statusId": status_id, "count": delta}
+            for status_id, delta in deltas.items() if delta and status_id is not None]
+    if not rows:
+        return
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ("sqlite", "mysql"): #one upsert statement for all the statuses
+        if dialect == "sqlite":
+            statement = sqlite_insert(TaskStatusCounter).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=["projectId", "statusId"],
+                set_={"count": TaskStatusCounter.count + statement.excluded["count"]}
+            )
+        else:
+            statement = mysql_insert(TaskStatusCounter).values(rows)
+            statement = statement.on_duplicate_key_update(count=TaskStatusCounter.count + statement.inserted["count"])
+        db.session.execute(statement)
+        return
+
+    for row in rows:
+        if _increment_counter(project_id, row["statusId"], row["count"]):
+            continue
+        try:
+            with db.session.begin_nested(): #first task with this status in the project
+                db.session.execute(db.insert(TaskStatusCounter).values(**row))
+        except IntegrityError: #a concurrent request created the row first
+            _increment_counter(project_id, row["statusId"], row["count"])
+
+
+def decrement_task_counter(project_id, status):
+    """
+    Takes one task off the counter of status, which can be a scalar subquery reading
+    the status of the task being changed, so the task does not have to be loaded first
+    """
+    _increment_counter(project_id, status, -1)
+
+
+def status_deltas(added=(), removed=()):
+    """
+    {statusId: delta} from the statuses of added and removed tasks
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    return dict(deltas)
+
+
+def get_task_counters(project_id):
+    return dict(db.session.execute(
+        db.select(TaskStatusCounter.statusId, TaskStatusCounter.count)
+        .where(TaskStatusCounter.projectId == project_id, TaskStatusCounter.count != 0)
+    ).all())
+
+
+def rebuild_task_counters(project_id=None):
+    """
+    Recomputes the counters from the task table, for one project or for all of them
+    """
+    delete_query = db.delete(TaskStatusCounter)
+    count_query = (db.select(Task.projectId, Task.statusId, db.func.count())
+                   .group_by(Task.projectId, Task.statusId))
+    if project_id is not None:
+        delete_query = delete_query.where(TaskStatusCounter.projectId == project_id)
+        count_query = count_query.where(Task.projectId == project_id)
+
+    db.session.execute(delete_query)
+    db.session.execute(db.insert(TaskStatusCounter).from_select(["projectId", "statusId", "count"], count_query))
+    db.session.commit()
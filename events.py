@@ -0,0 +1,170 @@
+from collections import deque, namedtuple
+from threading import Event as ThreadEvent, Lock
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from models import db
+import asyncio
+import secrets
+
+
+ChangeEvent = namedtuple("ChangeEvent", ["id", "kind", "data"])
+
+
+class Subscription:
+    """
+    Events waiting for one SSE client. Past max_pending the client is too slow,
+    its stream ends and it resumes from the ring buffer with Last-Event-ID
+    """
+    def __init__(self, project_id, max_pending, backlog):
+        self.project_id = project_id
+        self.reset = backlog is None
+        self.events = deque(backlog or ())
+        self.overflowed = False
+        self._max_pending = max_pending
+        #under asgi.py the stream runs in a greenlet on the event loop, it must not block the thread
+        self._loop = asyncio.get_running_loop() if in_greenlet() else None
+        self._wakeup = asyncio.Event() if self._loop else ThreadEvent()
+
+    def push(self, event):
+        if len(self.events) >= self._max_pending:
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        else:
+            self._wakeup.set()
+
+    def wait(self, timeout):
+        if self._loop:
+            try:
+                await_only(asyncio.wait_for(self._wakeup.wait(), timeout))
+            except asyncio.TimeoutError:
+                pass
+        else:
+            self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+
+def parse_event_id(value):
+    """
+    (boot, n) from "<boot>-<n>" as sent in the id: lines, raises ValueError for anything else.
+    A bare number, from before ids had a boot, gives a boot of None
+    """
+    boot, _, number = value.rpartition("-")
+    return boot or None, int(number)
+
+
+class EventBroker:
+    """
+    In-process fan-out of task changes. Every project keeps its last buffer_size events
+    for Last-Event-ID resumes, ids grow by one per project and restart with the process,
+    so each worker process serves the writes it handled itself.
+    The ids sent to clients are "<boot>-<n>", a resume from another process or an earlier
+    run of this one has a different boot and gets reset
+    """
+    def __init__(self, buffer_size=1000, max_pending=1000):
+        self.buffer_size = buffer_size
+        self.max_pending = max_pending
+        self.boot = secrets.token_hex(4)
+        self._lock = Lock()
+        self._last_ids = {}
+        self._buffers = {}
+        self._subscribers = {}
+
+    def publish(self, project_id, kind, data):
+        with self._lock: #pushing under the lock keeps every subscriber's events in id order
+            event = ChangeEvent(self._last_ids.get(project_id, 0) + 1, kind, data)
+            self._last_ids[project_id] = event.id
+            self._buffers.setdefault(project_id, deque(maxlen=self.buffer_size)).append(event)
+            for subscription in self._subscribers.get(project_id, ()):
+                subscription.push(event)
+
+    def subscribe(self, project_id, last_event_id=None):
+        """
+        Without last_event_id only new events are sent. Otherwise, with last_event_id as
+        (boot, n) from parse_event_id, the missed ones are replayed, or the subscription
+        starts with reset when they already left the buffer or were never published here
+        """
+        with self._lock:
+            last_id = self._last_ids.get(project_id, 0)
+            buffer = self._buffers.get(project_id, ())
+            if last_event_id is None:
+                backlog = []
+            elif last_event_id[0] == self.boot and last_id - len(buffer) <= last_event_id[1] <= last_id:
+                backlog = [event for event in buffer if event.id > last_event_id[1]]
+            else:
+                backlog = None
+            subscription = Subscription(project_id, self.max_pending, backlog)
+            self._subscribers.setdefault(project_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.project_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.project_id, None)
+
+
+def get_broker():
+    broker = current_app.extensions.get("events")
+    if broker is None:
+        broker = current_app.extensions.setdefault("events", EventBroker(
+            current_app.config["EVENTS_BUFFER_SIZE"], current_app.config["EVENTS_SUBSCRIBER_QUEUE"]
+        ))
+    return broker
+
+
+def queue_event(project_id, kind, data):
+    """
+    Published once the session commits, dropped on rollback
+    """
+    db.session.info.setdefault("events_pending", []).append((project_id, kind, data))
+
+
+def event_stream(project_id, last_event_id=None):
+    """
+    The text/event-stream body, it doesn't need the app context or a database connection
+    """
+    broker = get_broker()
+    keepalive = current_app.config["EVENTS_KEEPALIVE"]
+
+    def generate():
+        subscription = broker.subscribe(project_id, last_event_id)
+        try:
+            if subscription.reset:
+                yield "event: reset\ndata: {}\n\n"
+            while True:
+                sent = False
+                while subscription.events:
+                    event = subscription.events.popleft()
+                    yield f"id: {broker.boot}-{event.id}\nevent: {event.kind}\ndata: {event.data}\n\n"
+                    sent = True
+                if subscription.overflowed:
+                    return
+                if not sent:
+                    yield ": keepalive\n\n" #also how a closed connection gets noticed
+                subscription.wait(keepalive)
+        finally:
+            broker.unsubscribe(subscription)
+
+    return generate()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending_events(session):
+    pending = session.info.pop("events_pending", None)
+    if pending and has_app_context():
+        broker = get_broker()
+        dumps = current_app.json.dumps
+        for project_id, kind, data in pending:
+            broker.publish(project_id, kind, dumps(data))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_events(session):
+    session.info.pop("events_pending", None)
@@ -0,0 +1,169 @@
+from datetime import datetime, timedelta
+from functools import wraps
+from hashlib import sha256
+from threading import Event as ThreadEvent, Lock
+from flask import current_app, request, jsonify, make_response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from models import db, IdempotencyKey
+from validators.cache import idempotency_cache, MISSING
+import asyncio
+
+
+class Flight:
+    """
+    The first request with a key, duplicates in this process wait for it instead of running the view
+    """
+    def __init__(self):
+        #under asgi.py every request is a greenlet on the event loop, waiting must not block the thread
+        self._event = asyncio.Event() if in_greenlet() else ThreadEvent()
+
+    def done(self):
+        self._event.set()
+
+    def wait(self, timeout):
+        if isinstance(self._event, ThreadEvent):
+            return self._event.wait(timeout)
+        try:
+            await_only(asyncio.wait_for(self._event.wait(), timeout))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+_flights = {}
+_flights_lock = Lock()
+
+
+def _fingerprint():
+    return sha256(b"|".join([request.method.encode(), request.path.encode(), request.get_data()])).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    stored_fingerprint, status, body, mimetype = stored
+    if stored_fingerprint != fingerprint:
+        return jsonify({"message": "Idempotency-Key was already used for another request"}), 422
+    response = current_app.response_class(body, status=status, mimetype=mimetype)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _in_progress():
+    return jsonify({"message": "A request with this Idempotency-Key is still running"}), 409, \
+        {"Retry-After": str(current_app.config["IDEMPOTENCY_RETRY_AFTER"])}
+
+
+def _claim(user_id, key, fingerprint):
+    """
+    Inserts the pending row, which makes this request the one that runs the view in every process.
+    Returns the stored response of a finished request instead, or None when another one is running
+    """
+    config = current_app.config
+    row = db.session.execute(
+        db.select(IdempotencyKey.id, IdempotencyKey.fingerprint, IdempotencyKey.status,
+                  IdempotencyKey.body, IdempotencyKey.mimetype, IdempotencyKey.created_at)
+        .where(IdempotencyKey.userId == user_id, IdempotencyKey.key == key)
+    ).first()
+    if row:
+        age = datetime.now() - row.created_at
+        expired = age > timedelta(seconds=config["IDEMPOTENCY_TTL"])
+        abandoned = row.status is None and age > timedelta(seconds=config["IDEMPOTENCY_LOCK_TIMEOUT"])
+        if not expired and not abandoned:
+            if row.status is None:
+                return None
+            return (row.fingerprint, row.status, row.body, row.mimetype)
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.id == row.id))
+    try:
+        db.session.execute(db.insert(IdempotencyKey).values(
+            userId=user_id, key=key, fingerprint=fingerprint, created_at=datetime.now()
+        ))
+        db.session.commit()
+    except IntegrityError: #another process claimed it between the select and the insert
+        db.session.rollback()
+        return None
+    return True
+
+
+def _finish(user_id, key, fingerprint, response):
+    """
+    Stores the response for replays, 5xx responses release the key so a retry runs the view again
+    """
+    where = (IdempotencyKey.userId == user_id, IdempotencyKey.key == key)
+    db.session.rollback() #whatever the view left uncommitted is not part of its response
+    if response.status_code >= 500 or response.is_streamed:
+        db.session.execute(db.delete(IdempotencyKey).where(*where))
+        db.session.commit()
+        return
+    body = response.get_data(as_text=True)
+    db.session.execute(db.update(IdempotencyKey).where(*where).values(
+        status=response.status_code, body=body, mimetype=response.mimetype
+    ))
+    db.session.commit()
+    idempotency_cache.set((user_id, key), (fingerprint, response.status_code, body, response.mimetype))
+
+
+def idempotent(func):
+    """
+    Requests with an Idempotency-Key header run the view once per user and key,
+    repeats within IDEMPOTENCY_TTL get the stored response with "Idempotent-Replayed: true".
+    Duplicates arriving while the first one runs wait for it in this process,
+    in other processes they get 409. Goes under @jwt_token_required and @project_role_required
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return func(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"message": "Idempotency-Key can be at most 255 characters"}), 400
+
+        user_id = kwargs["user"].id
+        fingerprint = _fingerprint()
+        stored = idempotency_cache.get((user_id, key))
+        if stored is not MISSING:
+            return _replay(stored, fingerprint)
+
+        with _flights_lock:
+            flight = _flights.get((user_id, key))
+            leader = flight is None
+            if leader:
+                flight = _flights[(user_id, key)] = Flight()
+        if not leader:
+            flight.wait(current_app.config["IDEMPOTENCY_LOCK_TIMEOUT"])
+            stored = idempotency_cache.get((user_id, key))
+            return _replay(stored, fingerprint) if stored is not MISSING else _in_progress()
+
+        try:
+            claimed = _claim(user_id, key, fingerprint)
+            if claimed is None:
+                return _in_progress()
+            if claimed is not True:
+                idempotency_cache.set((user_id, key), claimed)
+                return _replay(claimed, fingerprint)
+            try:
+                response = make_response(func(*args, **kwargs))
+            except Exception:
+                db.session.rollback()
+                db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.userId == user_id,
+                                                                   IdempotencyKey.key == key))
+                db.session.commit()
+                raise
+            _finish(user_id, key, fingerprint, response)
+            return response
+        finally:
+            with _flights_lock:
+                _flights.pop((user_id, key), None)
+            flight.done()
+    return wrapper
+
+
+def purge_idempotency_keys(older_than):
+    """
+    Deletes the keys created before older_than, returns how many
+    """
+    deleted = db.session.execute(
+        db.delete(IdempotencyKey).where(IdempotencyKey.created_at < older_than)
+    ).rowcount
+    db.session.commit()
+    return deleted
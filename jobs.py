@@ -0,0 +1,346 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from flask import current_app, has_app_context
+from sqlalchemy import event, or_, and_
+from sqlalchemy.orm import Session
+from models import db, Job, Project, ProjectRole, Task, TaskArchive, TaskStatusCounter
+from counters import adjust_task_counters
+from events import queue_event
+from search import get_search_index
+from statuses import get_status_registry
+from versioning import bump_project_revision
+from validators.validators import invalidate_project_role
+import json
+import logging
+import os
+
+
+logger = logging.getLogger("jobs")
+
+JOB_KINDS = {}
+
+#what a handler gets about its job, progress is where a retried job left off
+JobContext = namedtuple("JobContext", ["id", "projectId", "params", "progress", "total"])
+
+
+def job_kind(name):
+    def decorator(func):
+        JOB_KINDS[name] = func
+        return func
+    return decorator
+
+
+def enqueue_job(kind, project_id, user_id, params):
+    """
+    Adds the job to the caller's transaction, workers are woken up after the commit
+    """
+    job = Job(kind=kind, projectId=project_id, userId=user_id, status="queued",
+              params=json.dumps(params), progress=0, attempts=0, created_at=datetime.now())
+    db.session.add(job)
+    db.session.info["jobs_enqueued"] = True
+    return job
+
+
+def set_progress(job_id, progress, total=None):
+    """
+    Call it in the transaction of the chunk, so progress and work commit together
+    """
+    values = {"progress": progress, "updated_at": datetime.now()}
+    if total is not None:
+        values["total"] = total
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(**values))
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "project_id": job.projectId,
+        "status": job.status,
+        "params": json.loads(job.params),
+        "progress": job.progress,
+        "total": job.total,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _claimable(stale_before):
+    return or_(Job.status == "queued", and_(Job.status == "running", Job.updated_at < stale_before))
+
+
+def claim_job():
+    """
+    Marks the oldest queued job, or a running one whose worker died, as running by this worker.
+    The conditional UPDATE makes the claim atomic between threads and processes
+    """
+    stale_before = datetime.now() - timedelta(seconds=current_app.config["JOBS_STALE_AFTER"])
+    while True:
+        #one walk of the (status, id) index per status, the OR of both would be sorted
+        candidates = [db.session.execute(db.select(Job.id).where(*where).order_by(Job.id).limit(1)).scalar()
+                      for where in ((Job.status == "queued",),
+                                    (Job.status == "running", Job.updated_at < stale_before))]
+        job_id = min((candidate for candidate in candidates if candidate is not None), default=None)
+        if job_id is None:
+            db.session.rollback()
+            return None
+        now = datetime.now()
+        claimed = db.session.execute(
+            db.update(Job).where(Job.id == job_id, _claimable(stale_before))
+            .values(status="running", started_at=now, updated_at=now, attempts=Job.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return job_id
+
+
+def finish_job(job_id, status, result=None, error=None):
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(
+        status=status, result=json.dumps(result) if result is not None else None, error=error,
+        finished_at=datetime.now(), updated_at=datetime.now()
+    ))
+    db.session.commit()
+
+
+def requeue_job(job_id, error):
+    """
+    Puts a failed job back in the queue, the kinds are written to resume from their progress
+    """
+    db.session.execute(db.update(Job).where(Job.id == job_id).values(
+        status="queued", error=error, updated_at=datetime.now()
+    ))
+    db.session.info["jobs_enqueued"] = True
+    db.session.commit()
+
+
+def run_job(job_id):
+    job = db.session.get(Job, job_id)
+    context = JobContext(job.id, job.projectId, json.loads(job.params), job.progress, job.total)
+    kind, attempts = job.kind, job.attempts
+    db.session.commit()
+    if attempts > current_app.config["JOBS_MAX_ATTEMPTS"]:
+        finish_job(job_id, "failed", error="Worker stopped too many times while running the job")
+        return
+    try:
+        result = JOB_KINDS[kind](context)
+    except Exception as error:
+        db.session.rollback()
+        logger.exception("Job %s (%s) failed", job_id, kind)
+        if attempts < current_app.config["JOBS_MAX_ATTEMPTS"]:
+            requeue_job(job_id, str(error))
+        else:
+            finish_job(job_id, "failed", error=str(error))
+    else:
+        finish_job(job_id, "done", result)
+
+
+class JobRunner:
+    """
+    Worker threads that claim jobs from the job table. Every process may run one,
+    they coordinate through the table. New jobs of this process wake them up,
+    jobs queued by others are noticed within poll_interval
+    """
+    def __init__(self, app, workers, poll_interval):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._wakeup = Event()
+        self._stopping = Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job_id = None
+            try:
+                with self.app.app_context():
+                    job_id = claim_job()
+                    if job_id is not None:
+                        run_job(job_id)
+            except Exception:
+                logger.exception("Job worker error")
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+_runner_lock = Lock()
+
+
+def get_job_runner(app):
+    runner = app.extensions.get("job_runner")
+    if runner is None:
+        with _runner_lock:
+            runner = app.extensions.get("job_runner")
+            if runner is None:
+                runner = app.extensions["job_runner"] = JobRunner(
+                    app, app.config["JOBS_WORKERS"], app.config["JOBS_POLL_INTERVAL"]
+                )
+                runner.start()
+    return runner
+
+
+def init_jobs(app):
+    """
+    Starts the worker threads with the first request, so CLI commands don't run jobs.
+    JOBS_WORKERS = 0 leaves the jobs to `flask run-jobs`
+    """
+    if app.config["JOBS_WORKERS"] > 0:
+        @app.before_request
+        def start_job_runner():
+            get_job_runner(app)
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_workers(session):
+    if session.info.pop("jobs_enqueued", False) and has_app_context():
+        runner = current_app.extensions.get("job_runner")
+        if runner:
+            runner.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_enqueued(session):
+    session.info.pop("jobs_enqueued", None)
+
+
+#JOB KINDS
+@job_kind("delete_project")
+def delete_project(job):
+    """
+    Removes the members first so the project disappears for them right away,
+    then the tasks and archived tasks in chunks, then the project.
+    A failure after the members are gone is retried by run_job, or the project would stay half deleted
+    """
+    project_id = job.projectId
+    chunk = current_app.config["JOBS_CHUNK_SIZE"]
+    members = db.session.execute(
+        db.select(ProjectRole.userId).where(ProjectRole.projectId == project_id)
+    ).scalars().all()
+    if members:
+        db.session.execute(db.delete(ProjectRole).where(ProjectRole.projectId == project_id))
+        db.session.commit()
+        for user_id in members:
+            invalidate_project_role(user_id, project_id)
+
+    done = job.progress
+    total = done + db.session.execute(
+        db.select(db.func.count()).select_from(Task).where(Task.projectId == project_id)
+    ).scalar()
+    set_progress(job.id, done, total)
+    db.session.commit()
+    while True:
+        task_ids = db.session.execute(
+            db.select(Task.id).where(Task.projectId == project_id).order_by(Task.id).limit(chunk)
+        ).scalars().all()
+        if not task_ids:
+            break
+        db.session.execute(db.delete(Task).where(Task.id.in_(task_ids)),
+                           execution_options={"synchronize_session": False})
+        get_search_index().remove(task_ids)
+        done += len(task_ids)
+        set_progress(job.id, done)
+        db.session.commit()
+
+    while True:
+        archived_ids = db.session.execute(
+            db.select(TaskArchive.id).where(TaskArchive.projectId == project_id).order_by(TaskArchive.id).limit(chunk)
+        ).scalars().all()
+        if not archived_ids:
+            break
+        db.session.execute(db.delete(TaskArchive).where(TaskArchive.id.in_(archived_ids)),
+                           execution_options={"synchronize_session": False})
+        db.session.commit()
+
+    db.session.execute(db.delete(TaskStatusCounter).where(TaskStatusCounter.projectId == project_id))
+    db.session.execute(db.delete(Project).where(Project.id == project_id))
+    db.session.commit()
+    return {"deleted_tasks": done}
+
+
+@job_kind("migrate_status")
+def migrate_status(job):
+    """
+    Moves every task of the project from one status to another, a chunk per transaction
+    """
+    project_id = job.projectId
+    from_status, to_status = job.params["from_status"], job.params["to_status"]
+    chunk = current_app.config["JOBS_CHUNK_SIZE"]
+    in_status = (Task.projectId == project_id, Task.statusId == from_status)
+
+    done = job.progress
+    total = done + db.session.execute(db.select(db.func.count()).select_from(Task).where(*in_status)).scalar()
+    set_progress(job.id, done, total)
+    db.session.commit()
+    while True:
+        task_ids = db.session.execute(
+            db.select(Task.id).where(*in_status).order_by(Task.id).limit(chunk)
+        ).scalars().all()
+        if not task_ids:
+            break
+        db.session.execute(db.update(Task).where(Task.id.in_(task_ids), *in_status).values(statusId=to_status, version=Task.version + 1),
+                           execution_options={"synchronize_session": False})
+        adjust_task_counters(project_id, {from_status: -len(task_ids), to_status: len(task_ids)})
+        bump_project_revision(project_id)
+        for task_id in task_ids:
+            queue_event(project_id, "updated", {"id": task_id, "statusId": to_status})
+        done += len(task_ids)
+        set_progress(job.id, done)
+        db.session.commit()
+    return {"migrated_tasks": done}
+
+
+@job_kind("export")
+def export_project(job):
+    """
+    Writes the tasks as NDJSON to JOBS_EXPORT_DIR, keyset pages so no cursor stays open between chunks.
+    A retried export starts over
+    """
+    project_id = job.projectId
+    chunk = current_app.config["JOBS_CHUNK_SIZE"]
+    statuses = get_status_registry() if job.params.get("include_status", False) else None
+    columns = [Task.id, Task.name, Task.description, Task.creation_date, Task.statusId, Task.projectId]
+
+    total = db.session.execute(
+        db.select(db.func.count()).select_from(Task).where(Task.projectId == project_id)
+    ).scalar()
+    set_progress(job.id, 0, total)
+    db.session.commit()
+
+    export_dir = current_app.config["JOBS_EXPORT_DIR"]
+    os.makedirs(export_dir, exist_ok=True)
+    filename = f"project_{project_id}_job_{job.id}.ndjson"
+    dumps = current_app.json.dumps
+    done, last_id = 0, 0
+    with open(os.path.join(export_dir, filename), "w", encoding="utf-8") as f:
+        while True:
+            rows = db.session.execute(
+                db.select(*columns).where(Task.projectId == project_id, Task.id > last_id).order_by(Task.id).limit(chunk)
+            ).all()
+            if not rows:
+                break
+            page = [row._asdict() for row in rows]
+            if statuses:
+                statuses.add_names(page)
+            f.writelines(dumps(row) + "\n" for row in page)
+            last_id = rows[-1].id
+            done += len(rows)
+            set_progress(job.id, done)
+            db.session.commit()
+    return {"file": filename, "rows": done}
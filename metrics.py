@@ -0,0 +1,186 @@
+from flask import g, request, has_request_context, current_app, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+import logging
+import time
+
+
+logger = logging.getLogger("metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name + _format_labels(self.labels, labels), value) for labels, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self._values = {}  #labels -> [bucket counts..., sum, count]
+        self._lock = Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for labels, entry in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, entry):
+                    cumulative += count
+                    samples.append((self.name + "_bucket" + _format_labels(self.labels, labels, f'le="{bound}"'), cumulative))
+                samples.append((self.name + "_bucket" + _format_labels(self.labels, labels, 'le="+Inf"'), entry[-1]))
+                samples.append((self.name + "_sum" + _format_labels(self.labels, labels), entry[-2]))
+                samples.append((self.name + "_count" + _format_labels(self.labels, labels), entry[-1]))
+        return samples
+
+
+class Registry:
+    """
+    Process-wide metrics, rendered in the Prometheus text format.
+    Every worker process has its own registry
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.counter("http_requests_total", "Requests by route, method and status", ("route", "method", "status"))
+request_duration = registry.histogram("http_request_duration_seconds", "Request latency", ("route", "method"))
+request_queries = registry.histogram("http_request_sql_queries", "SQL statements per request", ("route", "method"), QUERY_BUCKETS)
+request_sql_duration = registry.histogram("http_request_sql_duration_seconds", "Total SQL time per request", ("route", "method"))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    if not has_request_context() or "sql_count" not in g:
+        return
+    g.sql_count += 1
+    g.sql_time += elapsed
+    if len(g.sql_statements) < 100: #kept for the slow request log
+        g.sql_statements.append((elapsed, statement))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_statements = []
+
+
+def _finish_request(response):
+    if "request_started" not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    labels = (route, request.method)
+    requests_total.inc((route, request.method, str(response.status_code)))
+    request_duration.observe(labels, elapsed)
+    request_queries.observe(labels, g.sql_count)
+    request_sql_duration.observe(labels, g.sql_time)
+
+    threshold = current_app.config["SLOW_REQUEST_THRESHOLD_MS"]
+    if threshold and elapsed * 1000 >= threshold:
+        statements = "\n".join(f"  {duration * 1000:.1f}ms {statement}" for duration, statement in g.sql_statements)
+        logger.warning("Slow request %s %s: %.1fms, %d queries, %.1fms in SQL\n%s",
+                       request.method, request.path, elapsed * 1000, g.sql_count, g.sql_time * 1000, statements)
+    return response
+
+
+def metrics_view():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    """
+    Hooks the request timing into the app and exposes /metrics
+    """
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    if app.config["METRICS_ENABLED"]:
+        app.add_url_rule("/metrics", "metrics", metrics_view)
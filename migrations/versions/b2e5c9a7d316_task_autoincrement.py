@@ -0,0 +1,38 @@
+"""task autoincrement
+
+Revision ID: b2e5c9a7d316
+Revises: a8d3f6b2c947
+Create Date: 2025-02-13 09:40:12.661830
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e5c9a7d316'
+down_revision = 'a8d3f6b2c947'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    #SQLite gives out max(id) + 1, so ids of deleted and archived tasks came back.
+    #AUTOINCREMENT keeps a high-water mark instead, other databases never reuse ids
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('task', recreate='always', table_kwargs={'sqlite_autoincrement': True}) as batch_op:
+        pass
+    #the mark starts above every id already given out, archived ones included
+    op.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'task', 0 "
+               "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'task')")
+    op.execute("UPDATE sqlite_sequence SET seq = max(seq, "
+               "(SELECT coalesce(max(id), 0) FROM task), (SELECT coalesce(max(id), 0) FROM task_archive)) "
+               "WHERE name = 'task'")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table('task', recreate='always', table_kwargs={'sqlite_autoincrement': False}) as batch_op:
+        pass
@@ -0,0 +1,36 @@
+"""task full text search
+
+Revision ID: f2a7c4e9b615
+Revises: e1f8b3c6d904
+Create Date: 2025-01-10 19:42:16.830245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7c4e9b615'
+down_revision = 'e1f8b3c6d904'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # only SQLite has FTS5, other databases use the in-process index from search.py
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts "
+        "USING fts5(name, description, projectId UNINDEXED)"
+    )
+    op.execute(
+        "INSERT INTO task_fts(rowid, name, description, projectId) "
+        "SELECT id, name, description, projectId FROM task"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TABLE IF EXISTS task_fts")
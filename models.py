@@ -1,8 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import Integer, String, DateTime, ForeignKey
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Index, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from flask_migrate import Migrate
+from replicas import RoutingSession
 
 import datetime
 
@@ -10,7 +10,7 @@ import datetime
 class Base(DeclarativeBase):
     ...
     
-db = SQLAlchemy(model_class=Base)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
 
 class Project(db.Model):
@@ -18,12 +18,20 @@ class Project(db.Model):
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(150), nullable=False, unique=True)
+    #bumped by every write to the project, its tasks or roles, drives the ETags
+    revision: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    #bumped by every change of the project row itself, If-Match of PUT/PATCH compares it
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     
     tasks = relationship("Task", back_populates="project")
     
     
 class ProjectRole(db.Model):
     __tablename__ = "projectRole"
+    __table_args__ = (
+        Index("uq_projectRole_userId_projectId", "userId", "projectId", unique=True),
+        Index("ix_projectRole_projectId", "projectId"),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     userId: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"))
@@ -38,9 +46,9 @@ class User(db.Model):
     __tablename__ = "user"
     
     id: Mapped[int] = mapped_column(Integer, autoincrement=True, primary_key=True)
-    name: Mapped[str] = mapped_column(String(50), nullable=False)
-    password: Mapped[str] = mapped_column(String(75), nullable=False)
-    token: Mapped[str] = mapped_column(String(500), nullable=False)
+    name: Mapped[str] = mapped_column(String(50), nullable=False, unique=True, index=True)
+    password: Mapped[str] = mapped_column(String(255), nullable=False) #werkzeug hash, legacy rows are plaintext until the next login
+    token: Mapped[str] = mapped_column(String(500), nullable=False, index=True)
     
     roles = relationship("ProjectRole", back_populates="user")
     
@@ -55,8 +63,22 @@ class StatusList(db.Model):
     tasks = relationship("Task", back_populates="status")
     
     
+class StatusListVersion(db.Model):
+    __tablename__ = "status_list_version"
+
+    #a single row, bumped with every change of status_list so workers know to reload it
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class Task(db.Model):
     __tablename__ = "task"
+    __table_args__ = (
+        Index("ix_task_projectId_id", "projectId", "id"),
+        Index("ix_task_projectId_statusId", "projectId", "statusId"),
+        #SQLite would hand the highest id out again once its row is deleted or archived
+        {"sqlite_autoincrement": True},
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     name: Mapped[str] = mapped_column(String(150), nullable=False)
@@ -64,7 +86,79 @@ class Task(db.Model):
     creation_date: Mapped[datetime] = mapped_column(DateTime)
     statusId: Mapped[int] = mapped_column(Integer, ForeignKey("status_list.id"))
     projectId: Mapped[int] = mapped_column(Integer, ForeignKey("project.id"))
+    #bumped by every write to the task, If-Match of PUT/PATCH compares it
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     status = relationship("StatusList", back_populates="tasks")
     project = relationship("Project", back_populates="tasks")
-    
\ No newline at end of file
+
+
+class TaskArchive(db.Model):
+    """
+    Old tasks in terminal statuses moved out of task by `flask archive-tasks`, they keep their ids
+    """
+    __tablename__ = "task_archive"
+    __table_args__ = (
+        Index("ix_task_archive_projectId_id", "projectId", "id"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    name: Mapped[str] = mapped_column(String(150), nullable=False)
+    description: Mapped[str] = mapped_column(String(300), nullable=False)
+    creation_date: Mapped[datetime] = mapped_column(DateTime)
+    statusId: Mapped[int] = mapped_column(Integer, ForeignKey("status_list.id"))
+    projectId: Mapped[int] = mapped_column(Integer, ForeignKey("project.id"))
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    archived_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class TaskStatusCounter(db.Model):
+    __tablename__ = "task_status_counter"
+    
+    projectId: Mapped[int] = mapped_column(Integer, ForeignKey("project.id"), primary_key=True)
+    statusId: Mapped[int] = mapped_column(Integer, ForeignKey("status_list.id"), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class Job(db.Model):
+    __tablename__ = "job"
+    __table_args__ = (
+        Index("ix_job_status_id", "status", "id"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    kind: Mapped[str] = mapped_column(String(50), nullable=False)
+    #no foreign key, a delete_project job outlives its project
+    projectId: Mapped[int] = mapped_column(Integer, nullable=False)
+    userId: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="queued") #queued, running, done, failed
+    params: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    progress: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total: Mapped[int] = mapped_column(Integer, nullable=True)
+    result: Mapped[str] = mapped_column(Text, nullable=True)
+    error: Mapped[str] = mapped_column(Text, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    #heartbeat of the worker, a running job that stops moving is picked up again
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+
+class IdempotencyKey(db.Model):
+    __tablename__ = "idempotency_key"
+    __table_args__ = (
+        Index("ix_idempotency_key_userId_key", "userId", "key", unique=True),
+        Index("ix_idempotency_key_created_at", "created_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    userId: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False)
+    key: Mapped[str] = mapped_column(String(255), nullable=False)
+    #sha256 of method, path and body, the same key with another request is refused
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    #null while the first request runs
+    status: Mapped[int] = mapped_column(Integer, nullable=True)
+    body: Mapped[str] = mapped_column(Text, nullable=True)
+    mimetype: Mapped[str] = mapped_column(String(100), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
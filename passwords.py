@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+from flask import current_app
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from werkzeug.security import generate_password_hash, check_password_hash
+import asyncio
+import hmac
+
+
+HASH_PREFIXES = ("pbkdf2:", "scrypt:")
+
+
+class HasherBusy(Exception):
+    """
+    Every worker and queue slot is taken, the request should fail fast with 503
+    """
+
+
+class PasswordHasher:
+    """
+    Runs password hashing on a bounded thread pool. hashlib releases the GIL while hashing,
+    so the threads use the cores while request workers only wait.
+    At most workers + queue hashes are in flight, past that submit raises HasherBusy
+    """
+    def __init__(self, method, workers, queue):
+        self.method = method
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = BoundedSemaphore(workers + queue)
+
+    def _submit(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _wait(future):
+        if in_greenlet(): #under asgi.py, wait on the event loop instead of blocking it
+            return await_only(asyncio.wrap_future(future))
+        return future.result()
+
+    def hash(self, password):
+        return self._wait(self._submit(generate_password_hash, password, self.method))
+
+    def hash_many(self, passwords):
+        """
+        Hashes in windows of `workers` so a big batch can't take the whole queue
+        """
+        hashes = []
+        for start in range(0, len(passwords), self.workers):
+            futures = [self._submit(generate_password_hash, password, self.method)
+                       for password in passwords[start:start + self.workers]]
+            hashes.extend(self._wait(future) for future in futures)
+        return hashes
+
+    def verify(self, stored, password):
+        if not is_hashed(stored): #legacy plaintext row, cheap to compare
+            return hmac.compare_digest(stored.encode(), password.encode())
+        return self._wait(self._submit(check_password_hash, stored, password))
+
+    def needs_rehash(self, stored):
+        """
+        Plaintext rows and hashes made with an older method or cost
+        """
+        return not is_hashed(stored) or stored.split("$", 1)[0] != self.method
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def is_hashed(stored):
+    return stored.startswith(HASH_PREFIXES) and stored.count("$") == 2
+
+
+def get_password_hasher():
+    hasher = current_app.extensions.get("password_hasher")
+    if hasher is None:
+        config = current_app.config
+        hasher = PasswordHasher(config["PASSWORD_HASH_METHOD"], config["PASSWORD_HASH_WORKERS"],
+                                config["PASSWORD_HASH_QUEUE"])
+        created = hasher
+        hasher = current_app.extensions.setdefault("password_hasher", hasher)
+        if hasher is not created: #another request got there first
+            created.shutdown()
+    return hasher
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+from flask import g, current_app, request
+from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import warnings
+
+
+logger = logging.getLogger("query_budget")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _report(message):
+    mode = current_app.config["QUERY_BUDGET_MODE"]
+    if mode == "raise" or (mode == "auto" and current_app.testing):
+        raise QueryBudgetExceeded(message)
+    if mode == "warn" or (mode == "auto" and current_app.debug):
+        warnings.warn(message, RuntimeWarning, stacklevel=3)
+        logger.warning(message)
+
+
+def query_budget(max_queries):
+    """
+    Declares how many SQL statements a view may run, counted by metrics.py from the
+    start of the request (auth and membership lookups included, with cold caches).
+    QUERY_BUDGET_MODE: "raise" fails the request, "warn" logs, "off" does nothing,
+    "auto" raises under app.testing and warns under app.debug.
+    Goes right under @main.route
+    """
+    def decorator(func):
+        func.query_budget = max_queries
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            response = func(*args, **kwargs)
+            used = g.get("sql_count", 0)
+            if used > max_queries:
+                statements = "\n".join(f"  {statement}" for _, statement in g.get("sql_statements", []))
+                _report(f"{request.method} {request.path} ran {used} SQL statements, "
+                        f"its budget is {max_queries}\n{statements}")
+            return response
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def assert_max_queries(max_queries):
+    """
+    Fails when the block runs more than max_queries SQL statements, for tests:
+
+        with assert_max_queries(3):
+            client.get("/projects/1/tasks", headers=headers)
+    """
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "before_cursor_execute", count)
+    if len(statements) > max_queries:
+        raise QueryBudgetExceeded(
+            f"{len(statements)} SQL statements, the budget is {max_queries}\n" +
+            "\n".join(f"  {statement}" for statement in statements)
+        )
@@ -0,0 +1,49 @@
+from contextlib import contextmanager
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from sqlalchemy.sql.dml import UpdateBase
+
+
+REPLICA_BIND = "replica"
+
+
+class RoutingSession(Session):
+    """
+    Sends the reads of views marked @read_only to the "replica" bind when one is configured.
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and has_request_context() and g.get("use_replica")):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(func):
+    """
+    Marks a view that never writes, its queries may be served by the replica.
+    Replicas lag, so a read right after a write can miss it.
+    Goes right under @main.route
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def on_primary():
+    """
+    Reads of the block go to the primary even in a @read_only view,
+    for results that outlive the request, like the identity and membership caches
+    """
+    previous = g.get("use_replica")
+    g.use_replica = False
+    try:
+        yield
+    finally:
+        g.use_replica = previous
@@ -1,15 +1,74 @@
-from flask import Blueprint, request, jsonify
-from models import db, Project, ProjectRole, User, StatusList, Task
-from validators.validators import jwt_token_required
+from flask import Blueprint, request, jsonify, current_app, g, Response, stream_with_context, send_from_directory
+from models import db, Project, ProjectRole, User, Task, TaskArchive, Job
+from validators.validators import jwt_token_required, project_role_required, get_project_role, invalidate_project_role
+from validators.cache import identity_cache
+from serializers import task_serializer, archived_task_serializer, project_role_serializer
+from versioning import bump_project_revision, make_etag, conditional_get, \
+    if_match_versions, versioned_update, version_response, precondition_failed
+from counters import adjust_task_counters, decrement_task_counter, status_deltas, get_task_counters
+from search import get_search_index, tokenize
+from query_budget import query_budget
+from replicas import read_only
+from passwords import get_password_hasher, HasherBusy
+from events import queue_event, event_stream, parse_event_id
+from jobs import JOB_KINDS, enqueue_job, job_to_dict
+from statuses import get_status_registry
+from admission import admission_limit, admit, release
+from idempotency import idempotent
 from flask_jwt_extended import create_access_token
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from collections import defaultdict
+from datetime import date, datetime, time
+import json
+import os
 
 
 main = Blueprint('main', __name__)
+main.before_request(admit)
+main.teardown_request(release)
+
+
+def projects_etag(user):
+    memberships = db.session.execute(
+        db.select(ProjectRole.id, ProjectRole.projectId, Project.revision)
+        .join(Project, Project.id == ProjectRole.projectId)
+        .where(ProjectRole.userId == user.id)
+        .order_by(ProjectRole.projectId) #the order of the (userId, projectId) index
+    ).all()
+    return make_etag(user.id, [tuple(row) for row in memberships])
+
+
+def project_etag(project_id, user, **kwargs):
+    #the whole row in one query, project_by_id answers from it
+    g.project = db.session.execute(
+        db.select(Project.name, Project.version, Project.revision).where(Project.id == project_id)
+    ).first()
+    return make_etag(user.id, project_id, g.project.revision if g.project else None)
+
+
+def statuses_etag(user, **kwargs):
+    return make_etag(get_status_registry().current_version())
+
+
+def end_of_day_or_time(value):
+    """
+    Inclusive upper bound from an ISO value, a date alone stands for the whole day
+    """
+    try:
+        return datetime.combine(date.fromisoformat(value), time.max)
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+
+@main.errorhandler(HasherBusy)
+def hasher_busy(error):
+    return jsonify({"message": "Server is busy, retry later"}), 503, \
+        {"Retry-After": str(current_app.config["PASSWORD_HASH_RETRY_AFTER"])}
 
 
 #POST REQUESTS
 @main.route("/register", methods=["POST"])
+@query_budget(2)
 def register():
     """
     Creates new user in the system
@@ -20,24 +79,29 @@ def register():
     """
     req = request.get_json()
 
-    select_query = db.select(User.name)
-    result = db.session.execute(select_query)
-    users = result.scalars().all()
-
     username = req.get("username")
     password = req.get("password")
+    if not isinstance(username, str) or not isinstance(password, str) or not username or not password:
+        return jsonify({"message": "username and password must be non empty strings"}), 400
 
-    if username in users:
+    #unique index on user.name, so this is a single index lookup
+    select_query = db.select(User.id).filter_by(name=username)
+    if db.session.execute(select_query).first():
         return jsonify({"message": "This username is already used"}), 401
     
     access_token = create_access_token(identity=username)
     user = User(
         name=username,
-        password=password,
+        password=get_password_hasher().hash(password),
         token=access_token
     )
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError: #somebody took the name between the check and the insert
+        db.session.rollback()
+        return jsonify({"message": "This username is already used"}), 401
+    identity_cache.invalidate(username)
 
     return jsonify({
         "username": username,
@@ -47,50 +111,129 @@ def register():
         }), 200
 
 
+@main.route("/register/batch", methods=["POST"])
+@query_budget(2)
+@admission_limit(rate=1, burst=3, concurrency=2)
+def register_batch():
+    """
+    Creates many users in one transaction, for onboarding imports
+    Request: {
+        "users": [
+            {"username": username, "password": password},
+            ...
+        ]
+    }
+    Response contains a result for every row in the same order
+    """
+    req = request.get_json()
+    rows = req.get("users") if req else None
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"message": "users must be a non empty list"}), 400
+    if len(rows) > current_app.config["REGISTER_BATCH_MAX"]:
+        return jsonify({"message": f"Too many users, max is {current_app.config['REGISTER_BATCH_MAX']}"}), 400
+
+    def field(row, name): #non empty string or None
+        value = row.get(name) if isinstance(row, dict) else None
+        return value if isinstance(value, str) and value else None
+
+    names = {field(row, "username") for row in rows} - {None}
+    #one IN lookup on the unique index instead of loading every username
+    taken = set(db.session.execute(
+        db.select(User.name).where(User.name.in_(names))
+    ).scalars())
+
+    results = []
+    new_users = []
+    for i, row in enumerate(rows):
+        username = field(row, "username")
+        password = field(row, "password")
+        if not username or not password:
+            results.append({"row": i, "username": username, "status": "invalid",
+                            "message": "username and password must be non empty strings"})
+        elif username in taken:
+            results.append({"row": i, "username": username, "status": "conflict",
+                            "message": "This username is already used"})
+        else:
+            taken.add(username) #duplicates inside one batch are conflicts too
+            access_token = create_access_token(identity=username)
+            new_users.append({"name": username, "password": password, "token": access_token})
+            results.append({"row": i, "username": username, "status": "created",
+                            "token": access_token})
+
+    if new_users:
+        hashes = get_password_hasher().hash_many([new_user["password"] for new_user in new_users])
+        for new_user, password_hash in zip(new_users, hashes):
+            new_user["password"] = password_hash
+        try:
+            db.session.execute(db.insert(User), new_users) #one executemany, ids are not needed
+            db.session.commit()
+        except IntegrityError: #a concurrent signup took one of the names, nothing was written
+            db.session.rollback()
+            return jsonify({"message": "Usernames changed during import, retry the batch"}), 409
+        for new_user in new_users:
+            identity_cache.invalidate(new_user["name"])
+
+    created = sum(1 for result in results if result["status"] == "created")
+    return jsonify({"message": f"{created} of {len(rows)} users registered",
+                    "results": results}), 200
+
+
 @main.route("/login", methods=["POST"])
+@query_budget(2)
+@admission_limit(rate=2, burst=10)
 def login():
     req = request.get_json()   
     username = req.get("username")
     password = req.get("password")
     
-    user = User.query.filter_by(name=username).first()
+    user = User.query.filter_by(name=username).first() if isinstance(username, str) else None
     if not user:
         return jsonify({"message": "User not found"}), 404
-    if user.password != password:
+    hasher = get_password_hasher()
+    #the hasher only takes strings
+    if not isinstance(password, str) or not password or not hasher.verify(user.password, password):
         return jsonify({"message": "Wrong password"}), 401
+    if hasher.needs_rehash(user.password): #plaintext rows and older costs are upgraded on the way in
+        user.password = hasher.hash(password)
+        db.session.commit()
     
-    return jsonify({"message": "Cool", "token": user.token}), 200
+    #stored tokens expire, so every login gets a fresh one
+    access_token = create_access_token(identity=username)
+    return jsonify({"message": "Cool", "token": access_token}), 200
 
 
 @main.route("/projects", methods=["POST"])
+@query_budget(6)
 @jwt_token_required
-def create_project():
+@idempotent
+def create_project(user):
     """
     Creating new project
     Request: {
         "project_name": project_name
     }
+    An Idempotency-Key header makes retries safe, repeats get the first response back
     """
     req = request.get_json()
     name = req.get("project_name")
-    token = request.headers.get("Authorization").split(' ', 1)[1]
-
-    user = User.query.filter_by(token=token).first()
       
     project = Project(name = name)
     db.session.add(project)
     db.session.flush()
 
-    projectRole = ProjectRole(userId = user.id, projectId = project.id, role = "owner" )
+    project_id = project.id
+    projectRole = ProjectRole(userId = user.id, projectId = project_id, role = "owner" )
     
     db.session.add(projectRole)
     db.session.commit()
+    invalidate_project_role(user.id, project_id)
     
     return jsonify({"message": "Project created",
-                    "project": {"name": project.name, "id": project.id}}), 200
+                    "project": {"name": name, "id": project_id}}), 200
 
 
 @main.route("/connect_to_project", methods=["POST"])
+@query_budget(0)
 def connect_to_project():
     #TODO Make another connecting system, like invites 
     ...
@@ -128,222 +271,683 @@ def connect_to_project():
     
     
 @main.route("/projects/<int:project_id>/tasks", methods=["POST"])
+@query_budget(12)
 @jwt_token_required
-def create_task(project_id):
+@project_role_required()
+@idempotent
+def create_task(project_id, user):
     """
     Creates new task in project
     Request: {
         "task_name": task name
         "task_description": task description
     }
+    An Idempotency-Key header makes retries safe, repeats get the first response back
     """  
     req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        project = ProjectRole.query.filter_by(userId=user.id, projectId = project_id).first() 
-        name = req.get("task_name")
-        description = req.get("description")
-        
-        task = Task(name = name, description = description, creation_date = datetime.date.today() ,statusId = 1, projectId = project_id)
+    name = req.get("task_name")
+    description = req.get("description")
+    
+    task = Task(name = name, description = description, creation_date = datetime.now(), statusId = 1, projectId = project_id)
+
+    db.session.add(task)
+    db.session.flush()
+    get_search_index().add([{"id": task.id, "name": task.name, "description": task.description, "projectId": project_id}])
+    adjust_task_counters(project_id, {task.statusId: 1})
+    bump_project_revision(project_id)
+    #read before commit, which expires the instance and would reload it
+    task_data = {"id": task.id, "name": task.name, "description": task.description, "creation date": task.creation_date, "status id": task.statusId,
+                 "status name": get_status_registry().name(task.statusId), "project id": task.projectId}
+    queue_event(project_id, "created", {"id": task.id, "name": task.name, "description": task.description,
+                                        "creation_date": task.creation_date, "statusId": task.statusId, "projectId": project_id})
+    db.session.commit()
+    
+    return jsonify({"message": "task succesfully created",
+                    "task": task_data}), 200
 
-        db.session.add(task)
+@main.route("/projects/<int:project_id>/tasks/batch", methods=["POST"])
+@query_budget(20)
+@admission_limit(rate=5, burst=10, concurrency=4)
+@jwt_token_required
+@project_role_required()
+def batch_tasks(project_id, user):
+    """
+    Runs many task operations in one transaction
+    Request: {
+        "operations": [
+            {"op": "create", "task_name": task name, "description": task description},
+            {"op": "update", "id": task id, "name": new name, "description": new description, "status": status id or name},
+            {"op": "delete", "id": task id},
+            ...
+        ]
+    }
+    Creates run first, then updates, then deletes, so one task can't be both updated and deleted.
+    Response contains a result for every operation in the same order
+    """
+    req = request.get_json()
+    operations = req.get("operations") if req else None
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"message": "operations must be a non empty list"}), 400
+    if len(operations) > current_app.config["TASKS_BATCH_MAX"]:
+        return jsonify({"message": f"Too many operations, max is {current_app.config['TASKS_BATCH_MAX']}"}), 400
+
+    results = [None] * len(operations)
+    creates, updates, deletes = [], [], []
+    for i, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        if op == "create":
+            if all(isinstance(operation.get(name), str) and operation[name] for name in ("task_name", "description")):
+                creates.append((i, operation))
+                continue
+            results[i] = {"op": op, "status": "error", "message": "task_name and description must be non empty strings"}
+        elif op in ("update", "delete"):
+            task_id = operation.get("id")
+            if not isinstance(task_id, int) or isinstance(task_id, bool): #True is an int too
+                results[i] = {"op": op, "status": "error", "message": "id is required"}
+            elif op == "update" and any(not isinstance(operation.get(name), (str, type(None)))
+                                        for name in ("name", "description")):
+                results[i] = {"op": op, "status": "error", "id": task_id, "message": "name and description must be strings"}
+            else:
+                (updates if op == "update" else deletes).append((i, operation))
+        else:
+            results[i] = {"op": op, "status": "error", "message": "op must be create, update or delete"}
+
+    #operations run grouped by kind, not in request order, so a task may not be both updated and deleted
+    conflicting = {operation["id"] for _, operation in updates} & {operation["id"] for _, operation in deletes}
+    if conflicting:
+        return jsonify({"message": "A task can't be updated and deleted in the same batch",
+                        "ids": sorted(conflicting)}), 400
+
+    #one query tells which of the referenced tasks belong to this project, and their statuses
+    referenced = {operation["id"] for _, operation in updates + deletes}
+    existing = {}
+    if referenced:
+        existing = dict(db.session.execute(
+            db.select(Task.id, Task.statusId).where(Task.projectId == project_id, Task.id.in_(referenced))
+        ).all())
+    added_statuses, removed_statuses = [], []
+
+    try: #bulk statements run right away, so a constraint violation can come from any of them
+        if creates:
+            now = datetime.now()
+            rows = [{"name": operation["task_name"], "description": operation["description"],
+                     "creation_date": now, "statusId": 1, "projectId": project_id}
+                    for _, operation in creates]
+            if db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order:
+                new_ids = db.session.execute(
+                    db.insert(Task).returning(Task.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+            else: #no RETURNING for executemany (MySQL), the ORM batches what it can
+                tasks = [Task(**row) for row in rows]
+                db.session.add_all(tasks)
+                db.session.flush()
+                new_ids = [task.id for task in tasks]
+            for (i, _), task_id in zip(creates, new_ids):
+                results[i] = {"op": "create", "status": "ok", "id": task_id}
+            get_search_index().add([{**row, "id": task_id} for row, task_id in zip(rows, new_ids)])
+            for row, task_id in zip(rows, new_ids):
+                queue_event(project_id, "created", {"id": task_id, **row})
+            added_statuses += [1] * len(creates)
+
+        update_rows = []
+        statuses = get_status_registry()
+        for i, operation in updates:
+            if operation["id"] not in existing:
+                results[i] = {"op": "update", "status": "error", "id": operation["id"], "message": "Task doesn't exist"}
+                continue
+            status_id = statuses.resolve(operation["status"]) if operation.get("status") else None
+            if operation.get("status") and status_id is None:
+                results[i] = {"op": "update", "status": "error", "id": operation["id"], "message": "Such status does not exist"}
+                continue
+            row = {"id": operation["id"]}
+            if operation.get("name"):
+                row["name"] = operation["name"]
+            if operation.get("description"):
+                row["description"] = operation["description"]
+            if status_id is not None:
+                row["statusId"] = status_id
+                if status_id != existing[operation["id"]]:
+                    removed_statuses.append(existing[operation["id"]])
+                    added_statuses.append(status_id)
+                    existing[operation["id"]] = status_id
+            if len(row) > 1:
+                update_rows.append(row)
+            results[i] = {"op": "update", "status": "ok", "id": operation["id"]}
+        if update_rows:
+            groups = defaultdict(list) #one executemany per set of changed columns, each also bumps the version
+            for row in update_rows:
+                groups[tuple(sorted(row))].append(row)
+            table = Task.__table__
+            for rows in groups.values():
+                db.session.execute(
+                    table.update().where(table.c.id == db.bindparam("task_id")).values(version=table.c.version + 1),
+                    [{"task_id": row["id"], **{name: value for name, value in row.items() if name != "id"}} for row in rows]
+                )
+            get_search_index().update([row for row in update_rows if "name" in row or "description" in row])
+            for row in update_rows:
+                queue_event(project_id, "updated", row)
+
+        delete_ids = []
+        for i, operation in deletes:
+            if operation["id"] not in existing:
+                results[i] = {"op": "delete", "status": "error", "id": operation["id"], "message": "Task doesn't exist"}
+                continue
+            if operation["id"] not in delete_ids:
+                delete_ids.append(operation["id"])
+                removed_statuses.append(existing[operation["id"]])
+            results[i] = {"op": "delete", "status": "ok", "id": operation["id"]}
+        if delete_ids:
+            db.session.execute(
+                db.delete(Task).where(Task.projectId == project_id, Task.id.in_(delete_ids)),
+                execution_options={"synchronize_session": False}
+            )
+            get_search_index().remove(delete_ids)
+            for task_id in delete_ids:
+                queue_event(project_id, "deleted", {"id": task_id})
+
+        if creates or update_rows or delete_ids:
+            adjust_task_counters(project_id, status_deltas(added_statuses, removed_statuses))
+            bump_project_revision(project_id)
         db.session.commit()
-        
-        return jsonify({"message": "task succesfully created",
-                        "task": {"id": task.id, "name": task.name, "description": task.description, "creation date": task.creation_date, "status id": task.statusId, "project id": task.projectId}}), 200
-    else:
-        return jsonify({"message": "Invalid token"}), 401
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Batch rejected by the database, nothing was changed"}), 400
+
+    for i, result in enumerate(results):
+        result["index"] = i
+    return jsonify({"message": "Batch processed", "results": results}), 200
+
+@main.route("/projects/<int:project_id>/jobs", methods=["POST"])
+@query_budget(6)
+@admission_limit(rate=1, burst=5)
+@jwt_token_required
+@project_role_required()
+def create_job(project_id, user):
+    """
+    Starts a background job on the project and answers 202 right away
+    Request: {
+        "kind": "delete_project", "migrate_status" or "export",
+        "from_status": status id or name,     #migrate_status
+        "to_status": status id or name,       #migrate_status
+        "include_status": true        #export, optional
+    }
+    delete_project needs the Owner role. GET /jobs/<id> reports the progress
+    """
+    req = request.get_json(silent=True) or {}
+    kind = req.get("kind")
+    if kind not in JOB_KINDS:
+        return jsonify({"message": f"kind must be one of {', '.join(sorted(JOB_KINDS))}"}), 400
+
+    params = {}
+    if kind == "delete_project" and get_project_role(user.id, project_id) != "owner":
+        return jsonify({"message": "Only the Owner can delete the project"}), 403
+    if kind == "migrate_status":
+        statuses = get_status_registry()
+        from_status, to_status = statuses.resolve(req.get("from_status")), statuses.resolve(req.get("to_status"))
+        if from_status is None or to_status is None:
+            return jsonify({"message": "Such status does not exist"}), 400
+        if from_status == to_status:
+            return jsonify({"message": "from_status and to_status must be two different statuses"}), 400
+        params = {"from_status": from_status, "to_status": to_status}
+    if kind == "export":
+        params = {"include_status": bool(req.get("include_status"))}
+
+    job = enqueue_job(kind, project_id, user.id, params)
+    db.session.flush()
+    job_data = job_to_dict(job)
+    db.session.commit()
+    return jsonify({"message": "Job queued", "job": job_data}), 202, {"Location": f"/jobs/{job_data['id']}"}
 
 #GET REQUESTS
 @main.route("/projects", methods=["GET"])
+@query_budget(3)
+@read_only
 @jwt_token_required
-def all_projects():
-    user = User.query.filter_by(token=request.headers.get("Authorization").split(' ', 1)[1]).first() # type: ignore #Splitting the token from the header
-    if user: #if token is valid
-        projects = ProjectRole.query.filter_by(userId = user.id)
-        projects_dict = {}
-        for project in projects:
-            del project.__dict__['_sa_instance_state']
-            del project.__dict__["projectId"]
-            projects_dict[project.id] = project.__dict__
-
-        return jsonify(projects_dict), 200
-    else:
-        return jsonify({"message": "Invalid token"}), 401
+@conditional_get(projects_etag)
+def all_projects(user):
+    """
+    Query params:
+        fields - comma separated columns of ProjectRole to return
+    """
+    try:
+        fields = project_role_serializer.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    projects = project_role_serializer.all(
+        project_role_serializer.select(fields).where(ProjectRole.userId == user.id)
+    )
+    projects_dict = {project["id"]: project for project in projects}
+
+    return jsonify(projects_dict), 200
 
 
 @main.route("/projects/<int:project_id>")
+@query_budget(4)
+@read_only
 @jwt_token_required
-def project_by_id(project_id):
-    req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        project = ProjectRole.query.filter_by(userId = user.id, projectId = project_id).first()
-        all_project_members = ProjectRole.query.filter_by(projectId = project_id).all()  
-        del project.__dict__['_sa_instance_state']
-        del project.__dict__["id"]
-        project.__dict__["members_id"] = [all_project_members[i].userId for i in range(len(all_project_members))]
-    
-        return project.__dict__, 200
-    else:
-        return jsonify({"message": "Invalid token"}), 401
+@project_role_required(message="Such project does not exist")
+@conditional_get(project_etag)
+def project_by_id(project_id, user):
+    members_id = db.session.execute(
+        db.select(ProjectRole.userId).where(ProjectRole.projectId == project_id)
+    ).scalars().all()
+    if g.project is None: #deleted while the membership was still cached
+        return jsonify({"message": "Such project does not exist"}), 400
+    project = {
+        "userId": user.id,
+        "projectId": project_id,
+        "name": g.project.name,
+        "version": g.project.version, #for If-Match of PUT/PATCH /projects/<id>
+        "role": get_project_role(user.id, project_id),
+        "members_id": members_id
+    }
+
+    return project, 200
 
 
 @main.route("/projects/<int:project_id>/tasks", methods=["GET"])
+@query_budget(6)
+@admission_limit(rate=10, burst=20, concurrency=8)
+@read_only
 @jwt_token_required
-def all_tasks_in_project(project_id):
-    req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        if ProjectRole.query.filter_by(userId=user.id, projectId = project_id).first():
-            tasks = Task.query.filter_by(projectId = project_id).all()  
-            tasks_dict = {}
-            for task in tasks:
-                del task.__dict__['_sa_instance_state']
-                tasks_dict[task.id] = task.__dict__
-                
-            return jsonify(tasks_dict), 200
-        else: 
+@project_role_required(message="Such project does not exist")
+@conditional_get(project_etag)
+def all_tasks_in_project(project_id, user):
+    """
+    Returns one page of tasks ordered by id
+    Query params:
+        cursor - next_cursor from the previous page
+        limit - page size, capped by TASKS_PAGE_SIZE_MAX
+        status - only tasks with this status id or name
+        created_from, created_to - ISO dates, creation_date range (inclusive)
+        fields - comma separated columns of Task to return
+        include_archived - 1 to merge in tasks moved to task_archive, every task then has "archived"
+    """
+    try:
+        #int() raises for junk, type=int would silently fall back to the first page
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor is not None else None
+        limit = int(request.args.get("limit", current_app.config["TASKS_PAGE_SIZE"]))
+        status = request.args.get("status")
+        created_from = request.args.get("created_from")
+        created_to = request.args.get("created_to")
+        created_from = datetime.fromisoformat(created_from) if created_from else None
+        created_to = end_of_day_or_time(created_to) if created_to else None
+        fields = task_serializer.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"message": f"Wrong query parameters: {e}"}), 400
+    limit = max(1, min(limit, current_app.config["TASKS_PAGE_SIZE_MAX"]))
+    include_archived = request.args.get("include_archived", "0").lower() in ("1", "true", "yes")
+    statuses = get_status_registry()
+    if status is not None:
+        status = statuses.resolve(int(status) if status.isdigit() else status)
+        if status is None:
+            return jsonify({"message": "Such status does not exist"}), 400
+
+    def page(serializer, model):
+        query = serializer.select(fields).where(model.projectId == project_id)
+        if include_archived:
+            query = query.add_columns(db.literal(model is TaskArchive).label("archived"))
+        if cursor is not None:
+            query = query.where(model.id > cursor) #keyset, no OFFSET scan
+        if status is not None:
+            query = query.where(model.statusId == status)
+        if created_from:
+            query = query.where(model.creation_date >= created_from)
+        if created_to:
+            query = query.where(model.creation_date <= created_to)
+        return query
+
+    if include_archived: #both tables walked in (projectId, id) order and merged by id, nothing is sorted
+        query = db.union_all(page(task_serializer, Task), page(archived_task_serializer, TaskArchive)) \
+            .order_by(db.literal_column("id"))
+    else:
+        query = page(task_serializer, Task).order_by(Task.id)
+    query = query.limit(limit + 1)
+    tasks = statuses.add_names(task_serializer.all(query))
+
+    next_cursor = None
+    if len(tasks) > limit: #one extra row tells us there is another page
+        tasks = tasks[:limit]
+        next_cursor = tasks[-1]["id"]
+        
+    return jsonify({"tasks": tasks, "next_cursor": next_cursor}), 200
+
+
+@main.route("/projects/<int:project_id>/summary", methods=["GET"])
+@query_budget(4)
+@jwt_token_required
+@project_role_required(message="Such project does not exist")
+@conditional_get(project_etag)
+def project_summary(project_id, user):
+    """
+    Number of tasks in each status, read from the counters table
+    """
+    statuses = get_task_counters(project_id)
+    return jsonify({"project_id": project_id, "total": sum(statuses.values()), "statuses": statuses}), 200
+
+
+@main.route("/projects/<int:project_id>/tasks/export", methods=["GET"])
+@query_budget(5)
+@admission_limit(rate=0.1, burst=2, concurrency=2)
+@jwt_token_required
+@project_role_required(message="Such project does not exist")
+def export_tasks(project_id, user):
+    """
+    Streams every task of the project as newline-delimited JSON
+    Query params:
+        include_status - 1 to add "statusName"
+    Rows are fetched from a server-side cursor in EXPORT_CHUNK_SIZE batches,
+    so memory stays bounded whatever the size of the project
+    """
+    include_status = request.args.get("include_status", "0").lower() in ("1", "true", "yes")
+    columns = [Task.id, Task.name, Task.description, Task.creation_date, Task.statusId, Task.projectId]
+    select_query = db.select(*columns).where(Task.projectId == project_id).order_by(Task.id)
+    select_query = select_query.execution_options(yield_per=current_app.config["EXPORT_CHUNK_SIZE"])
+    statuses = get_status_registry() if include_status else None
+
+    def generate():
+        dumps = current_app.json.dumps
+        result = db.session.execute(select_query)
+        try:
+            for row in result:
+                row = row._asdict()
+                if statuses:
+                    statuses.add_names([row])
+                yield dumps(row) + "\n"
+        finally:
+            result.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f"attachment; filename=project_{project_id}_tasks.ndjson"})
+
+
+@main.route("/projects/<int:project_id>/events", methods=["GET"])
+@query_budget(2)
+@jwt_token_required
+@project_role_required(message="Such project does not exist")
+def project_events(project_id, user):
+    """
+    Server-Sent Events feed of the project's tasks: "created", "updated" and "deleted" events
+    with the task (or its changed fields) as data.
+    Reconnects send Last-Event-ID (or ?last_event_id=) and get the missed events replayed,
+    a "reset" event means they are gone and the tasks must be fetched again
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = parse_event_id(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"message": "Last-Event-ID must be an event id"}), 400
+
+    #no stream_with_context: the session goes back to the pool when the view returns
+    return Response(event_stream(project_id, last_event_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@main.route("/statuses", methods=["GET"])
+@query_budget(3)
+@jwt_token_required
+@conditional_get(statuses_etag)
+def all_statuses(user):
+    """
+    Every task status, served from the in-memory registry
+    """
+    return jsonify({"statuses": get_status_registry().all()}), 200
+
+
+@main.route("/statuses/<int:status_id>", methods=["GET"])
+@query_budget(3)
+@jwt_token_required
+@conditional_get(statuses_etag)
+def status_by_id(status_id, user):
+    status = get_status_registry().get(status_id)
+    if not status:
+        return jsonify({"message": "Such status does not exist"}), 404
+    return jsonify(status), 200
+
+
+@main.route("/search", methods=["GET"])
+@query_budget(7)
+@admission_limit(rate=5, burst=10, concurrency=4)
+@jwt_token_required
+def search_tasks(user):
+    """
+    Ranked search over task names and descriptions in the user's projects
+    Query params:
+        q - words to search, all of them must match
+        project_id - search only in this project
+        page, per_page - pagination, per_page is capped by TASKS_PAGE_SIZE_MAX
+    """
+    terms = tokenize(request.args.get("q"))
+    if not terms:
+        return jsonify({"message": "q is required"}), 400
+    try:
+        #int() raises for junk, type=int would silently fall back to the defaults
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", current_app.config["TASKS_PAGE_SIZE"]))
+        project_id = request.args.get("project_id")
+        project_id = int(project_id) if project_id is not None else None
+    except ValueError as e:
+        return jsonify({"message": f"Wrong query parameters: {e}"}), 400
+    page = max(1, page)
+    per_page = max(1, min(per_page, current_app.config["TASKS_PAGE_SIZE_MAX"]))
+
+    if project_id is not None:
+        if get_project_role(user.id, project_id) is None:
             return jsonify({"message": "Such project does not exist"}), 400
+        project_ids = [project_id]
+    else:
+        project_ids = db.session.execute(
+            db.select(ProjectRole.projectId).where(ProjectRole.userId == user.id)
+        ).scalars().all()
+
+    task_ids, total = [], 0
+    if project_ids:
+        task_ids, total = get_search_index().search(terms, project_ids, per_page, (page - 1) * per_page)
+    tasks = []
+    if task_ids:
+        found = task_serializer.all(task_serializer.select().where(Task.id.in_(task_ids)))
+        by_id = {task["id"]: task for task in found}
+        tasks = [by_id[task_id] for task_id in task_ids if task_id in by_id] #keep the rank order
+        get_status_registry().add_names(tasks)
+
+    return jsonify({"tasks": tasks, "page": page, "per_page": per_page, "total": total}), 200
+
+
+@main.route("/jobs/<int:job_id>", methods=["GET"])
+@query_budget(2)
+@jwt_token_required
+def job_by_id(job_id, user):
+    job = db.session.execute(db.select(Job).filter_by(id=job_id, userId=user.id)).scalar()
+    if not job:
+        return jsonify({"message": "Such job does not exist"}), 404
+    return jsonify({"job": job_to_dict(job)}), 200
 
-    
-    else:   
-        return jsonify({"message": "Invalid token"}), 401
+
+@main.route("/jobs/<int:job_id>/file", methods=["GET"])
+@query_budget(2)
+@jwt_token_required
+def job_file(job_id, user):
+    """
+    The NDJSON file written by a finished export job
+    """
+    job = db.session.execute(
+        db.select(Job.status, Job.result).filter_by(id=job_id, userId=user.id, kind="export")
+    ).first()
+    if not job:
+        return jsonify({"message": "Such export does not exist"}), 404
+    if job.status != "done":
+        return jsonify({"message": f"The export is {job.status}"}), 409
+    return send_from_directory(os.path.abspath(current_app.config["JOBS_EXPORT_DIR"]), json.loads(job.result)["file"],
+                               mimetype="application/x-ndjson", as_attachment=True)
 
 
 @main.route("/projects/<int:project_id>/tasks/<int:task_id>", methods=["GET"])
+@query_budget(6)
+@read_only
 @jwt_token_required
-def task_by_id(project_id, task_id):
-    req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        if ProjectRole.query.filter_by(userId=user.id, projectId = project_id).first():
-            task = Task.query.filter_by(projectId = project_id, id = task_id).first()
+@project_role_required(message="Such project does not exist")
+def task_by_id(project_id, task_id, user):
+    """
+    Query params:
+        fields - comma separated columns of Task to return
+        include_archived - 1 to look in task_archive too, the task then has "archived"
+    The ETag is the version of the task, for If-Match of PUT/PATCH
+    """
+    try:
+        fields = task_serializer.parse_fields(request.args.get("fields"))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    include_archived = request.args.get("include_archived", "0").lower() in ("1", "true", "yes")
+
+    task = task_serializer.first(
+        task_serializer.select(fields).where(Task.projectId == project_id, Task.id == task_id)
+    )
+    if include_archived:
+        if task:
+            task["archived"] = False
+        else:
+            task = archived_task_serializer.first(
+                archived_task_serializer.select(fields).where(TaskArchive.projectId == project_id, TaskArchive.id == task_id)
+            )
             if task:
-                del task.__dict__['_sa_instance_state']
-                
-                return task.__dict__
-            else: 
-                return jsonify({"message": "Such task does not exist"}), 400
-        else: 
-            return jsonify({"message": "Such project does not exist"}), 400
-        
-    else:   
-        return jsonify({"message": "Invalid token"}), 401
+                task["archived"] = True
+    if task:
+        get_status_registry().add_names([task])
+        return version_response(task, 200, task.get("version"))
+    else: 
+        return jsonify({"message": "Such task does not exist"}), 400
 
 
 #PUT REQUESTS
-@main.route("/projects/<int:project_id>", methods=["PUT"])
+@main.route("/projects/<int:project_id>", methods=["PUT", "PATCH"])
+@query_budget(4)
 @jwt_token_required
-def update_project_data(project_id):
+@project_role_required(owner=True, message="You don't participate in this project or you are not Owner of this project", status=403)
+def update_project_data(project_id, user):
+    """
+    Renames the project with one UPDATE, the project is not read first
+    Request: {
+        "name": new name
+    }
+    If-Match - the version of the project, 412 when it was changed since
+    """
+    if not request.data:
+        return jsonify({"message": "Your json request is empty"}), 415
     req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        user_role = ProjectRole.query.filter_by(userId = user.id, projectId = project_id).first()
-        if user_role and user_role.role == "owner":
-            if request.data:
-                project = Project.query.filter_by(id = project_id).first()    
-                if project:
-                    req = request.get_json()
-                    updated_name = req.get("name")
-                    old_name = project.name
-                    project.name = updated_name if updated_name else project.name
-                    db.session.add(project)
-                    db.session.commit()
-                    return jsonify({"message": f"Project name was succesfully updated from '{old_name}' to '{project.name}'"}), 200
-                    
-                else:
-                    return jsonify({"message": "Project does not exist or you have no access to it"}), 400
-            else:
-                return jsonify({"message": "Your json request is empty"}), 415
-        else:
-            return jsonify({"message": "You don't participate in this project or you are not Owner of this project"}), 403
-    else:   
-        return jsonify({"message": "Invalid token"}, 401)
+    if not isinstance(req, dict) or not isinstance(req.get("name"), (str, type(None))):
+        return jsonify({"message": "name must be a string"}), 400
+    new_name = req.get("name")
+    if not new_name:
+        return jsonify({"message": "Nothing to update"}), 400
+
+    try:
+        matched, version = versioned_update(Project, (Project.id == project_id,),
+                                            {"name": new_name, "revision": Project.revision + 1},
+                                            if_match_versions())
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Project with such name already exists"}), 400
+    if not matched:
+        db.session.rollback()
+        current = db.session.execute(db.select(Project.version).where(Project.id == project_id)).scalar()
+        if current is None:
+            return jsonify({"message": "Project does not exist or you have no access to it"}), 400
+        return precondition_failed(current)
+    db.session.commit()
+    return version_response({"message": f"Project name was succesfully updated to '{new_name}'",
+                             "version": version}, 200, version)
     
     
-@main.route("/projects/<int:project_id>/tasks/<int:task_id>", methods=["PUT"])
+@main.route("/projects/<int:project_id>/tasks/<int:task_id>", methods=["PUT", "PATCH"])
+@query_budget(10)
 @jwt_token_required
-def update_task_data(project_id, task_id):
+@project_role_required()
+def update_task_data(project_id, task_id, user):
+    """
+    Changes only the given fields with one UPDATE of the task, the task is not read first
+    Request: {
+        "name": new name,
+        "description": new description,
+        "status": status id or name
+    }
+    If-Match - the version of the task, 412 when it was changed since
+    """
+    if not request.data:
+        return jsonify({"message": "Your json request is empty"}), 415
     req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        user_role = ProjectRole.query.filter_by(userId = user.id, projectId = project_id).first()
-        if user_role:
-            if request.data:
-                task = Task.query.filter_by(id = task_id, projectId = project_id).first()    
-                if task:
-                    req = request.get_json()
-                    updated_name = req.get("name")
-                    updated_description = req.get("description")
-                    updated_status = req.get("status")
-                    
-                    task.name = updated_name if updated_name else task.name
-                    task.description = updated_description if updated_description else task.description
-                    task.statusId = updated_status if updated_status else task.statusId
-                    db.session.add(task)
-                    db.session.commit()
-                    return jsonify({"message": f"Task data was succesfully updated"}), 200
-                    
-                else:
-                    return jsonify({"message": "Task does not exist or you have no access to it"}), 400
-                
-            else:
-                return jsonify({"message": "Your json request is empty"}), 415 
-        else:
-            return jsonify({"message": "Project does not exist or you do not participate in this project"}), 400
-    else:   
-        return jsonify({"message": "Invalid token"}, 401)
+    if not isinstance(req, dict) or any(not isinstance(req.get(name), (str, type(None)))
+                                        for name in ("name", "description")):
+        return jsonify({"message": "name and description must be strings"}), 400
+    values = {name: req[name] for name in ("name", "description") if req.get(name)}
+    if req.get("status"):
+        values["statusId"] = get_status_registry().resolve(req["status"])
+        if values["statusId"] is None:
+            return jsonify({"message": "Such status does not exist"}), 400
+    if not values:
+        return jsonify({"message": "Nothing to update"}), 400
+
+    versions = if_match_versions()
+    where = (Task.id == task_id, Task.projectId == project_id)
+    if "statusId" in values:
+        #the old status is read (and the row locked) inside the counter update
+        old_status = db.select(Task.statusId).where(*where)
+        if versions is not None:
+            old_status = old_status.where(Task.version.in_(versions))
+        decrement_task_counter(project_id, old_status.with_for_update().scalar_subquery())
+    matched, version = versioned_update(Task, where, values, versions)
+    if not matched:
+        db.session.rollback()
+        current = db.session.execute(db.select(Task.version).where(*where)).scalar()
+        if current is None:
+            return jsonify({"message": "Task does not exist or you have no access to it"}), 400
+        return precondition_failed(current)
+
+    if "statusId" in values:
+        adjust_task_counters(project_id, {values["statusId"]: 1})
+    searchable = {name: values[name] for name in ("name", "description") if name in values}
+    if searchable:
+        get_search_index().update([{"id": task_id, **searchable}])
+    bump_project_revision(project_id)
+    queue_event(project_id, "updated", {"id": task_id, **values, "version": version})
+    db.session.commit()
+    return version_response({"message": "Task data was succesfully updated", "version": version}, 200, version)
 
 #DELETE REQUESTS
 @main.route("/projects/<int:project_id>", methods=["DELETE"])
+@query_budget(4)
 @jwt_token_required
-def leave_project(project_id): 
-    req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        user_role = ProjectRole.query.filter_by(userId = user.id, projectId = project_id).first()
-        if user_role and user_role.role == "owner":
-            req = request.get_json()
-            
-            username = user.name
-            password = user.password
-            
-            user = User.query.filter_by(name=username, password=password).first()
-            project = Project.query.filter_by(id = project_id).first()
-            
-            is_already_in_this_project = ProjectRole.query.filter_by(userId = user.id, projectId = project.id).first()
-            if is_already_in_this_project:
-                projectRole = ProjectRole.query.filter_by(projectId=project.id, userId=user.id).first()
-                db.session.delete(projectRole)
-                db.session.commit()
-                return jsonify({"message": "You left the project"}), 200
-            else:
-                return jsonify({"message": "You cannot leave a project that you are not a member of"}), 401
-            
-        else:
-            return jsonify({"message": "You don't participate in this project or you are not Owner of this project"}), 403
-    else:   
-        return jsonify({"message": "Invalid token"}, 401)
+@project_role_required(owner=True, message="You don't participate in this project or you are not Owner of this project", status=403)
+def leave_project(project_id, user): 
+    left = db.session.execute(
+        db.delete(ProjectRole).where(ProjectRole.userId == user.id, ProjectRole.projectId == project_id)
+    ).rowcount
+    if left:
+        bump_project_revision(project_id)
+        db.session.commit()
+        invalidate_project_role(user.id, project_id)
+        return jsonify({"message": "You left the project"}), 200
+    else:
+        db.session.rollback()
+        invalidate_project_role(user.id, project_id) #the cached role was stale
+        return jsonify({"message": "You cannot leave a project that you are not a member of"}), 401
     
 
 @main.route("/projects/<int:project_id>/tasks/<int:task_id>", methods=["DELETE"])
+@query_budget(7)
 @jwt_token_required
-def delete_task(project_id, task_id):
-    req = request.get_json()
-    user = User.query.filter_by(token=req.get("token")).first()
-    if user: #if token is valid
-        user_role = ProjectRole.query.filter_by(userId = user.id, projectId = project_id).first()
-        if user_role:
-            task = Task.query.filter_by(id = task_id, projectId = project_id).first()
-            if task:
-                db.session.delete(task)
-                db.session.commit()
-                return jsonify({"message": "Task has been deleted"}), 200
-            else:
-                return jsonify({"message": "Task doesn't exist"}), 401
-        else:
-            return jsonify({"message": "Project does not exist or you do not participate in this project"}), 400
-    else:   
-        return jsonify({"message": "Invalid token"}, 401)
-        
\ No newline at end of file
+@project_role_required()
+def delete_task(project_id, task_id, user):
+    task = Task.query.filter_by(id = task_id, projectId = project_id).first()
+    if task:
+        db.session.delete(task)
+        get_search_index().remove([task.id])
+        adjust_task_counters(project_id, {task.statusId: -1})
+        bump_project_revision(project_id)
+        queue_event(project_id, "deleted", {"id": task.id})
+        db.session.commit()
+        return jsonify({"message": "Task has been deleted"}), 200
+    else:
+        return jsonify({"message": "Task doesn't exist"}), 401
+        
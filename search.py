@@ -0,0 +1,254 @@
+from collections import Counter, defaultdict
+from threading import Lock, Thread
+from flask import current_app, has_app_context
+from sqlalchemy import event, text, bindparam
+from sqlalchemy.orm import Session
+from models import db, Task
+import logging
+import math
+import re
+import time
+
+
+logger = logging.getLogger("search")
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(value):
+    return [token.lower() for token in TOKEN_RE.findall(value or "")]
+
+
+class Fts5Index:
+    """
+    SQLite FTS5 table task_fts(name, description, projectId) with rowid = task id.
+    Writes run in the caller's transaction, so the index commits or rolls back with the tasks
+    """
+    def __init__(self):
+        self._table_checked = False
+
+    def ensure_table(self):
+        if self._table_checked: #normally created by the migration, this covers db.create_all()
+            return
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts "
+            "USING fts5(name, description, projectId UNINDEXED)"
+        ))
+        self._table_checked = True
+
+    def add(self, rows):
+        if not rows:
+            return
+        self.ensure_table()
+        db.session.execute(
+            text("INSERT INTO task_fts(rowid, name, description, projectId) "
+                 "VALUES (:id, :name, :description, :projectId)"),
+            [{key: row[key] for key in ("id", "name", "description", "projectId")} for row in rows]
+        )
+
+    def update(self, rows):
+        groups = defaultdict(list) #one executemany per set of changed columns
+        for row in rows:
+            columns = tuple(name for name in ("name", "description") if name in row)
+            if columns:
+                groups[columns].append({"id": row["id"], **{name: row[name] for name in columns}})
+        if not groups:
+            return
+        self.ensure_table()
+        for columns, params in groups.items():
+            db.session.execute(
+                text(f"UPDATE task_fts SET {', '.join(f'{name} = :{name}' for name in columns)} WHERE rowid = :id"),
+                params
+            )
+
+    def remove(self, task_ids):
+        if not task_ids:
+            return
+        self.ensure_table()
+        db.session.execute(
+            text("DELETE FROM task_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": list(task_ids)}
+        )
+
+    def search(self, terms, project_ids, limit, offset):
+        """
+        Returns ([task ids ordered by bm25 rank], total matches)
+        """
+        self.ensure_table()
+        #every term is quoted, so user input can't use the FTS5 query syntax
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        where = "task_fts MATCH :match AND projectId IN :project_ids"
+        params = {"match": match, "project_ids": list(project_ids)}
+        expanding = bindparam("project_ids", expanding=True)
+
+        total = db.session.execute(
+            text(f"SELECT COUNT(*) FROM task_fts WHERE {where}").bindparams(expanding), params
+        ).scalar()
+        ids = db.session.execute(
+            text(f"SELECT rowid FROM task_fts WHERE {where} ORDER BY bm25(task_fts) LIMIT :limit OFFSET :offset")
+            .bindparams(expanding),
+            {**params, "limit": limit, "offset": offset}
+        ).scalars().all()
+        return ids, total
+
+
+class MemoryIndex:
+    """
+    Portable in-process inverted index for databases without FTS5.
+    Built from the task table on first use. After max_age seconds the next search starts
+    a rebuild in the background and keeps answering from the current index meanwhile,
+    which bounds how long writes made by other workers stay invisible.
+    Writes are applied only after the session commits.
+    """
+
+    def __init__(self, max_age=60):
+        self.max_age = max_age
+        self._lock = Lock()
+        self._built_at = None
+        self._rebuilding = False
+        self._replay = None                 #changes committed while a build reads the table
+        self._postings = defaultdict(dict)  #token -> {task id: term frequency}
+        self._documents = {}                #task id -> [projectId, name tokens, description tokens]
+
+    def _build(self):
+        with self._lock:
+            if self._replay is None:
+                self._replay = []
+        postings = defaultdict(dict)
+        documents = {}
+        result = db.session.execute(
+            db.select(Task.id, Task.projectId, Task.name, Task.description).execution_options(yield_per=1000)
+        )
+        for row in result:
+            documents[row.id] = [row.projectId, tokenize(row.name), tokenize(row.description)]
+        for task_id, (_, name_tokens, description_tokens) in documents.items():
+            for token, count in Counter(name_tokens + description_tokens).items():
+                postings[token][task_id] = count
+        with self._lock:
+            self._postings, self._documents, self._built_at = postings, documents, time.monotonic()
+            replay, self._replay = self._replay or [], None
+            for changes in replay: #the snapshot may predate them, applying twice is harmless
+                self._apply(changes)
+
+    def _is_stale(self):
+        return time.monotonic() - self._built_at > self.max_age
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        app = current_app._get_current_object()
+
+        def rebuild():
+            try:
+                with app.app_context():
+                    self._build()
+            except Exception:
+                logger.exception("Search index rebuild failed")
+            finally:
+                self._rebuilding = False
+
+        #asgi.py registers a spawner that runs it as a greenlet on the event loop, the async drivers need that
+        spawn = app.extensions.get("spawn_background") or (lambda target: Thread(target=target, daemon=True).start())
+        spawn(rebuild)
+
+    def _unindex(self, task_id):
+        document = self._documents.pop(task_id, None)
+        if document:
+            for token in set(document[1] + document[2]):
+                self._postings[token].pop(task_id, None)
+        return document
+
+    def _index(self, task_id, project_id, name_tokens, description_tokens):
+        self._documents[task_id] = [project_id, name_tokens, description_tokens]
+        for token, count in Counter(name_tokens + description_tokens).items():
+            self._postings[token][task_id] = count
+
+    def _pending(self):
+        return db.session.info.setdefault("search_pending", [])
+
+    def add(self, rows):
+        self._pending().append(("add", [dict(row) for row in rows]))
+
+    def update(self, rows):
+        self._pending().append(("update", [dict(row) for row in rows]))
+
+    def remove(self, task_ids):
+        self._pending().append(("remove", list(task_ids)))
+
+    def apply(self, changes):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(changes)
+            if self._built_at is None: #nothing built yet, the first search reads the table
+                return
+            self._apply(changes)
+
+    def _apply(self, changes):
+        for kind, payload in changes:
+            if kind == "remove":
+                for task_id in payload:
+                    self._unindex(task_id)
+                continue
+            for row in payload:
+                document = self._unindex(row["id"])
+                if kind == "update" and not document:
+                    continue
+                project_id = row.get("projectId", document[0] if document else None)
+                name_tokens = tokenize(row["name"]) if "name" in row else document[1]
+                description_tokens = tokenize(row["description"]) if "description" in row else document[2]
+                self._index(row["id"], project_id, name_tokens, description_tokens)
+
+    def search(self, terms, project_ids, limit, offset):
+        """
+        Returns ([task ids ordered by tf-idf], total matches), every term must match
+        """
+        #the lock is never held across a query: under asgi.py every request is a greenlet on the same thread
+        if self._built_at is None:
+            self._build()
+        elif self._is_stale():
+            self._rebuild_in_background()
+        with self._lock:
+            project_ids = set(project_ids)
+            postings = [self._postings.get(term, {}) for term in terms]
+            if not postings or not all(postings):
+                return [], 0
+            candidates = set.intersection(*(set(posting) for posting in postings))
+            total_documents = len(self._documents)
+            scores = []
+            for task_id in candidates:
+                if self._documents[task_id][0] not in project_ids:
+                    continue
+                score = sum(posting[task_id] * math.log(1 + total_documents / len(posting)) for posting in postings)
+                scores.append((-score, task_id))
+        scores.sort()
+        return [task_id for _, task_id in scores[offset:offset + limit]], len(scores)
+
+
+def get_search_index():
+    """
+    The index chosen by SEARCH_BACKEND ("auto", "fts5" or "memory") for the current app
+    """
+    index = current_app.extensions.get("search_index")
+    if index is None:
+        backend = current_app.config["SEARCH_BACKEND"]
+        if backend == "auto":
+            backend = "fts5" if db.engine.dialect.name == "sqlite" else "memory"
+        index = Fts5Index() if backend == "fts5" else MemoryIndex(current_app.config["SEARCH_INDEX_MAX_AGE"])
+        current_app.extensions["search_index"] = index
+    return index
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_pending_changes(session):
+    changes = session.info.pop("search_pending", None)
+    if changes and has_app_context():
+        index = current_app.extensions.get("search_index")
+        if isinstance(index, MemoryIndex):
+            index.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_changes(session):
+    session.info.pop("search_pending", None)
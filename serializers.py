@@ -0,0 +1,106 @@
+from flask.json.provider import DefaultJSONProvider
+from models import db, ProjectRole, Task, TaskArchive
+
+try:
+    import orjson
+except ImportError: #optional, falls back to the stdlib json provider
+    orjson = None
+
+
+class ModelSerializer:
+    """
+    Serializes rows of selected columns instead of ORM instances.
+    Columns are resolved once at import, views only pick the projection.
+    """
+    def __init__(self, model, fields, default_fields=None, required_fields=()):
+        self.model = model
+        self.columns = {name: getattr(model, name) for name in fields}
+        self.default_fields = list(default_fields or fields)
+        self.required_fields = list(required_fields)
+
+    def parse_fields(self, fields=None):
+        """
+        Turns the ?fields=a,b query parameter into a list of field names.
+        Raises ValueError for unknown fields
+        """
+        if not fields:
+            return self.default_fields
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+        for name in reversed(self.required_fields):
+            if name not in names:
+                names.insert(0, name)
+        return names
+
+    def select(self, fields=None):
+        return db.select(*[self.columns[name] for name in (fields or self.default_fields)])
+
+    def all(self, statement):
+        result = db.session.execute(statement)
+        keys = list(result.keys())
+        return [dict(zip(keys, row)) for row in result]
+
+    def first(self, statement):
+        result = db.session.execute(statement)
+        row = result.first()
+        return dict(zip(result.keys(), row)) if row else None
+
+
+task_serializer = ModelSerializer(
+    Task,
+    ["id", "name", "description", "creation_date", "statusId", "projectId", "version"],
+    required_fields=["id"]
+)
+
+archived_task_serializer = ModelSerializer(
+    TaskArchive,
+    ["id", "name", "description", "creation_date", "statusId", "projectId", "version"],
+    required_fields=["id"]
+)
+
+project_role_serializer = ModelSerializer(
+    ProjectRole,
+    ["id", "userId", "projectId", "role"],
+    default_fields=["id", "userId", "role"],
+    required_fields=["id"]
+)
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    The default provider's output (http dates, sorted keys) encoded with orjson,
+    except that non-ASCII text is written as UTF-8 instead of \\u escapes.
+    Sorted dicts with non-str keys (all_projects is keyed by id) go through the stdlib:
+    orjson sorts such keys as strings (1, 10, 2), the stdlib by value (1, 2, 10)
+    """
+    def _dumps_bytes(self, obj, sort_keys=None):
+        option = orjson.OPT_PASSTHROUGH_DATETIME
+        if not (self.sort_keys if sort_keys is None else sort_keys):
+            return orjson.dumps(obj, default=self.default, option=option | orjson.OPT_NON_STR_KEYS)
+        try:
+            return orjson.dumps(obj, default=self.default, option=option | orjson.OPT_SORT_KEYS)
+        except orjson.JSONEncodeError: #a non-str key, or a value the stdlib fails on the same way
+            return super().dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {"sort_keys"}: #indent, separators... only the stdlib can do these
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj, kwargs.get("sort_keys")).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self._app.debug and self.compact is None: #keep pretty printing in debug mode
+            return super().response(obj)
+        return self._app.response_class(self._dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def init_json(app):
+    if orjson is not None and app.config["JSON_ENCODER"] == "orjson":
+        app.json = ORJSONProvider(app)
@@ -0,0 +1,121 @@
+from threading import Lock
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, StatusList, StatusListVersion
+import time
+
+
+class StatusRegistry:
+    """
+    status_list held in memory, so task writes validate statuses and serialized tasks
+    get their status names without a query. At most every check_interval seconds one
+    query compares status_list_version, the table is read again only when it changed
+    """
+    def __init__(self, check_interval=30):
+        self.check_interval = check_interval
+        self.version = None
+        self._lock = Lock()
+        self._checked_at = None
+        self._by_id = {}
+        self._by_name = {}
+
+    def load(self):
+        #the lock is never held across a query: under asgi.py every request is a greenlet on the same thread
+        version = db.session.execute(
+            db.select(StatusListVersion.version).where(StatusListVersion.id == 1)
+        ).scalar() or 0
+        if version == self.version and self._checked_at is not None:
+            self._checked_at = time.monotonic()
+            return
+        rows = db.session.execute(
+            db.select(StatusList.id, StatusList.statusName, StatusList.description).order_by(StatusList.id)
+        ).all()
+        by_id = {row.id: {"id": row.id, "name": row.statusName, "description": row.description} for row in rows}
+        with self._lock:
+            self._by_id = by_id
+            self._by_name = {status["name"]: status for status in by_id.values()}
+            self.version, self._checked_at = version, time.monotonic()
+
+    def invalidate(self):
+        self._checked_at = None
+
+    def _fresh(self):
+        if self._checked_at is None or time.monotonic() - self._checked_at > self.check_interval:
+            self.load()
+        return self
+
+    def current_version(self):
+        return self._fresh().version
+
+    def all(self):
+        return list(self._fresh()._by_id.values())
+
+    def get(self, status_id):
+        return self._fresh()._by_id.get(status_id)
+
+    def resolve(self, status):
+        """
+        The id of a status given by id or by name, None when there is no such status
+        """
+        self._fresh()
+        if isinstance(status, bool) or not isinstance(status, (int, str)):
+            return None
+        found = self._by_name.get(status) if isinstance(status, str) else self._by_id.get(status)
+        return found["id"] if found else None
+
+    def name(self, status_id):
+        status = self.get(status_id)
+        return status["name"] if status else None
+
+    def add_names(self, tasks):
+        """
+        Sets "statusName" on the task dicts that have "statusId"
+        """
+        by_id = self._fresh()._by_id
+        for task in tasks:
+            if "statusId" in task:
+                status = by_id.get(task["statusId"])
+                task["statusName"] = status["name"] if status else None
+        return tasks
+
+
+def get_status_registry():
+    registry = current_app.extensions.get("statuses")
+    if registry is None:
+        registry = current_app.extensions.setdefault(
+            "statuses", StatusRegistry(current_app.config["STATUS_CHECK_INTERVAL"])
+        )
+    return registry
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_status_version(session, flush_context):
+    """
+    Changes of status_list made through the ORM bump the version in the same transaction.
+    Edits made with plain SQL must bump status_list_version.version themselves
+    """
+    changed = session.new | session.dirty | session.deleted
+    if not any(isinstance(instance, StatusList) for instance in changed):
+        return
+    connection = session.connection()
+    table = StatusListVersion.__table__
+    bumped = connection.execute(
+        table.update().where(table.c.id == 1).values(version=table.c.version + 1)
+    ).rowcount
+    if not bumped: #tables made with create_all have no version row yet
+        connection.execute(table.insert().values(id=1, version=1))
+    session.info["statuses_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _reload_statuses(session):
+    if session.info.pop("statuses_changed", False) and has_app_context():
+        registry = current_app.extensions.get("statuses")
+        if registry:
+            registry.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_statuses_changed(session):
+    session.info.pop("statuses_changed", None)
@@ -0,0 +1,10 @@
+import os
+import sys
+
+#the modules live flat in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#create_app() reads its settings from the environment, the tests override the database per app
+os.environ.setdefault("SQLALCHEMY_DATABASE_URI", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-key-of-at-least-32-bytes")
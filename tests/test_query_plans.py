@@ -0,0 +1,165 @@
+"""
+Every statement the routes (and the jobs they start) run must use an index on SQLite.
+The SQL is recorded while driving each route with the test client, then checked
+with EXPLAIN QUERY PLAN: a SCAN of a table or a temp b-tree for ORDER BY fails
+"""
+from flask import request, request_started
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+import pytest
+
+from benchmarks.common import make_app, seed, BENCH_USER, BENCH_PASSWORD
+from models import db
+from jobs import claim_job, run_job
+from query_budget import assert_max_queries
+
+
+#tables read whole on purpose
+FULL_READS = {
+    "status_list": "the status registry keeps the whole list in memory",
+}
+
+#full-text tables whose matches are sorted by relevance, the MATCH itself uses the index
+RANKED = {
+    "task_fts": "search orders the matches by bm25",
+}
+
+#(method, url, json body, headers) in an order where every request finds what it needs
+REQUESTS = [
+    ("POST", "/register", {"username": "plan-user", "password": "p"}, {}),
+    ("POST", "/register/batch", {"users": [{"username": "plan-a", "password": "p"}, {"username": "plan-user", "password": "p"}]}, {}),
+    ("POST", "/login", {"username": BENCH_USER, "password": BENCH_PASSWORD}, {}),
+    ("POST", "/projects", {"project_name": "plan project"}, {}),
+    ("POST", "/projects", {"project_name": "plan project 2"}, {"Idempotency-Key": "plan-key"}),
+    ("POST", "/projects", {"project_name": "plan project 2"}, {"Idempotency-Key": "plan-key"}),
+    ("POST", "/projects/1/tasks", {"task_name": "plan task", "description": "plan"}, {}),
+    ("POST", "/projects/1/tasks/batch", {"operations": [
+        {"op": "create", "task_name": "batch", "description": "batch"},
+        {"op": "update", "id": 1, "name": "renamed", "status": 2},
+        {"op": "delete", "id": 11},
+    ]}, {}),
+    ("GET", "/projects", None, {}),
+    ("GET", "/projects/1", None, {}),
+    ("GET", "/projects/1/tasks", None, {}),
+    ("GET", "/projects/1/tasks?cursor=100&limit=20", None, {}),
+    ("GET", "/projects/1/tasks?status=done", None, {}),
+    ("GET", "/projects/1/tasks?created_from=2024-01-01&created_to=2024-01-02", None, {}),
+    ("GET", "/projects/1/tasks?include_archived=1", None, {}),
+    ("GET", "/projects/1/summary", None, {}),
+    ("GET", "/projects/1/tasks/export", None, {}),
+    ("GET", "/statuses", None, {}),
+    ("GET", "/statuses/1", None, {}),
+    ("GET", "/search?q=login%20crash", None, {}),
+    ("GET", "/search?q=login&project_id=1", None, {}),
+    ("GET", "/projects/1/tasks/21", None, {}),
+    ("GET", "/projects/1/tasks/1?include_archived=1", None, {}),
+    ("PUT", "/projects/1", {"name": "plan renamed"}, {}),
+    ("PATCH", "/projects/1/tasks/21", {"name": "patched", "status": "review"}, {"If-Match": '"0"'}),
+    ("PATCH", "/projects/1/tasks/21", {"name": "patched"}, {"If-Match": '"0"'}),
+    ("DELETE", "/projects/1/tasks/31", None, {}),
+    ("POST", "/projects/2/jobs", {"kind": "export"}, {}),
+    ("POST", "/projects/2/jobs", {"kind": "migrate_status", "from_status": 1, "to_status": 2}, {}),
+    ("POST", "/projects/3/jobs", {"kind": "delete_project"}, {}),
+    ("RUN_JOBS", None, None, {}),
+    ("GET", "/jobs/1", None, {}),
+    ("GET", "/jobs/1/file", None, {}),
+    ("DELETE", "/projects/4", None, {}),
+]
+
+#no SQL worth checking or a response that never ends
+SKIPPED_ENDPOINTS = {"main.connect_to_project", "main.project_events"}
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    app = make_app(tmp_path_factory.mktemp("plans") / "plans.db",
+                   JOBS_EXPORT_DIR=str(tmp_path_factory.mktemp("exports")), QUERY_BUDGET_MODE="raise")
+    seed(app, 1000)
+    return app
+
+
+@pytest.fixture(scope="module")
+def recorded(app):
+    """
+    The distinct statements run while driving REQUESTS, with their first parameters, and the endpoints hit
+    """
+    statements, endpoints = {}, set()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.setdefault(statement, parameters[0] if executemany else parameters)
+
+    def hit(sender, **extra):
+        endpoints.add(request.endpoint)
+
+    with app.app_context():
+        token = create_access_token(identity=BENCH_USER)
+        engine = db.engine
+    client = app.test_client()
+    event.listen(engine, "before_cursor_execute", record)
+    request_started.connect(hit, app)
+    try:
+        for method, url, body, headers in REQUESTS:
+            if method == "RUN_JOBS":
+                with app.app_context():
+                    while (job_id := claim_job()) is not None:
+                        run_job(job_id)
+                continue
+            response = client.open(url, method=method, json=body,
+                                   headers={"Authorization": f"Bearer {token}", **headers})
+            assert response.status_code < 500, f"{method} {url} answered {response.status_code}"
+            response.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        request_started.disconnect(hit, app)
+    return statements, endpoints
+
+
+def problems(connection, statement, parameters):
+    plan = [row[-1] for row in connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+    scanned = [line.split()[1] for line in plan if line.startswith("SCAN ")]
+    bad = []
+    for line in plan:
+        if line.startswith("USE TEMP B-TREE FOR ORDER BY"):
+            if not any(table in RANKED for table in scanned):
+                bad.append(line)
+        elif line.startswith("SCAN ") and "CONSTANT ROW" not in line and "VIRTUAL TABLE INDEX" not in line \
+                and line.split()[1] not in FULL_READS:
+            bad.append(line)
+    return bad, plan
+
+
+def test_every_route_is_driven(app, recorded):
+    _, endpoints = recorded
+    routes = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint.startswith("main.")}
+    missing = routes - endpoints - SKIPPED_ENDPOINTS
+    assert not missing, f"add requests for {sorted(missing)} to REQUESTS"
+
+
+def test_route_queries_use_indexes(app, recorded):
+    statements, _ = recorded
+    failures = []
+    with app.app_context(), db.engine.connect() as connection:
+        for statement, parameters in statements.items():
+            if not statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+                continue
+            bad, plan = problems(connection, statement, parameters)
+            if bad:
+                failures.append(f"{' '.join(statement.split())}\n    {' | '.join(plan)}")
+    assert not failures, "statements without an index:\n" + "\n".join(failures)
+
+
+@pytest.mark.parametrize("url", [
+    "/projects/5/tasks?limit={}",
+    "/projects/5/tasks?include_archived=1&limit={}",
+    "/search?q=task&project_id=5&per_page={}",
+])
+def test_list_queries_do_not_grow_with_the_page(app, url):
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=BENCH_USER)}"}
+    client = app.test_client()
+    client.get(url.format(1), headers=headers) #fills the identity and membership caches
+    with assert_max_queries(3) as one:
+        assert client.get(url.format(1), headers=headers).status_code == 200
+    with assert_max_queries(3) as page:
+        assert client.get(url.format(100), headers=headers).status_code == 200
+    assert len(page) == len(one), f"{len(one)} statements for one row, {len(page)} for a page"
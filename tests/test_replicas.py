@@ -0,0 +1,33 @@
+"""
+@read_only views read from the replica, but what they cache across requests must come from the primary.
+The replica is a second SQLite file that lags until the test copies the primary into it
+"""
+import sqlite3
+
+from benchmarks.common import make_app, seed, BENCH_USER
+from flask_jwt_extended import create_access_token
+from models import db
+
+
+def test_lagging_replica_does_not_poison_the_membership_cache(tmp_path):
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    app = make_app(primary, SQLALCHEMY_BINDS={"replica": {"url": f"sqlite:///{replica}"}})
+    seed(app, 0)
+    with app.app_context():
+        db.metadata.create_all(db.engines["replica"]) #the schema, but none of the rows yet
+        headers = {"Authorization": f"Bearer {create_access_token(identity=BENCH_USER)}"}
+    client = app.test_client()
+
+    response = client.post("/projects", json={"project_name": "fresh"}, headers=headers)
+    assert response.status_code == 200
+    project_id = response.get_json()["project"]["id"]
+
+    #the replica hasn't got the user, the project or the membership yet
+    response = client.get(f"/projects/{project_id}", headers=headers)
+    assert response.status_code < 500
+
+    with sqlite3.connect(primary) as source, sqlite3.connect(replica) as target:
+        source.backup(target)
+    response = client.get(f"/projects/{project_id}", headers=headers)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["name"] == "fresh"
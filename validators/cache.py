@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache where every entry also expires after ttl seconds.
+    Safe to share between the threads of one worker process.
+    None is a valid cached value, use MISSING to detect a miss.
+    """
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def configure(self, maxsize=None, ttl=None):
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+#JWT identity (username) -> CurrentUser
+identity_cache = TTLCache()
+
+#(user id, project id) -> role name, or None when the user is not a member
+membership_cache = TTLCache()
+
+#(user id, Idempotency-Key) -> the stored response, in front of the idempotency_key table
+idempotency_cache = TTLCache()
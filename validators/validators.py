@@ -1,20 +1,93 @@
-from flask import request, jsonify
+from flask import request, jsonify, g
 from functools import wraps
+from collections import namedtuple
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from models import db, User, ProjectRole
+from validators.cache import identity_cache, membership_cache, MISSING
+from replicas import on_primary
+
+
+#what the views get instead of a User row, enough to authorize without a query
+CurrentUser = namedtuple("CurrentUser", ["id", "name"])
 
 
 def jwt_token_required(func):
     """
-    Checks if token was given in request, requires "token" field
+    Checks the JWT from the "Authorization: Bearer <token>" header
+    and passes the caller to the view as the "user" argument
     """
     @wraps(func)
     def wrapper(*args, **kwargs):       
         token = request.headers.get("Authorization")
         if not token:
             return jsonify({"message": "Token required"}), 401
-        return func(*args, **kwargs)  
+        try:
+            verify_jwt_in_request() #signature and expiry are checked locally
+        except (JWTExtendedException, PyJWTError):
+            return jsonify({"message": "Invalid token"}), 401
+
+        identity = get_jwt_identity()
+        user = identity_cache.get(identity)
+        if user is MISSING:
+            with on_primary(): #a lagging replica would cache a missing user
+                row = db.session.execute(
+                    db.select(User.id, User.name).filter_by(name=identity)
+                ).first()
+            if not row:
+                return jsonify({"message": "Invalid token"}), 401
+            user = CurrentUser(row.id, row.name)
+            identity_cache.set(identity, user)
+
+        return func(*args, user=user, **kwargs)  
     return wrapper
 
 
+def get_project_role(user_id, project_id):
+    """
+    Returns the role of the user in the project or None if the user is not a member.
+    Memoized for the request in flask.g and across requests in membership_cache
+    """
+    key = (user_id, project_id)
+    memo = g.setdefault("project_roles", {})
+    if key in memo:
+        return memo[key]
+    role = membership_cache.get(key)
+    if role is MISSING:
+        with on_primary(): #a lagging replica would cache None for a new member
+            role = db.session.execute(
+                db.select(ProjectRole.role).filter_by(userId=user_id, projectId=project_id)
+            ).scalar()
+        membership_cache.set(key, role)
+    memo[key] = role
+    return role
+
+
+def invalidate_project_role(user_id, project_id):
+    """
+    Must be called after every change of a ProjectRole row
+    """
+    membership_cache.invalidate((user_id, project_id))
+    g.setdefault("project_roles", {}).pop((user_id, project_id), None)
+
+
+def project_role_required(owner=False, message="Project does not exist or you do not participate in this project", status=400):
+    """
+    Checks that the user from jwt_token_required participates in the project from the url,
+    with owner=True the user also must be the owner. Goes under @jwt_token_required
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            role = get_project_role(kwargs["user"].id, kwargs["project_id"])
+            if role is None or (owner and role != "owner"):
+                return jsonify({"message": message}), status
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 # def check_register_data(func):
 #     @wraps(func)
 #     def wrapper():
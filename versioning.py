@@ -0,0 +1,90 @@
+from flask import request, make_response, jsonify
+from functools import wraps
+from hashlib import sha1
+from models import db, Project
+
+
+def bump_project_revision(*project_ids):
+    """
+    Invalidates the ETags of the projects, call it in the same transaction as the write
+    """
+    db.session.execute(
+        db.update(Project)
+        .where(Project.id.in_(project_ids))
+        .values(revision=Project.revision + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def make_etag(*parts):
+    """
+    Strong ETag from the given parts and the query string, which changes the payload too
+    """
+    raw = "|".join(str(part) for part in parts) + "|" + request.query_string.decode()
+    return sha1(raw.encode()).hexdigest()
+
+
+def conditional_get(etag_for):
+    """
+    Computes the ETag with etag_for(**view_kwargs) before running the view,
+    returns 304 when it matches If-None-Match, otherwise tags the response.
+    Goes under @jwt_token_required and @project_role_required
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = etag_for(**kwargs)
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(func(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def if_match_versions():
+    """
+    The row versions listed in If-Match, None without the header or with "*".
+    Versions are strong ETags ("3"), any other tag can never match
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    return [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+
+
+def versioned_update(model, where, values, versions=None):
+    """
+    One UPDATE of only the given columns that also bumps model.version, the row is not read first.
+    With versions (from If-Match) the row must still have one of them.
+    Returns (matched, new version), the version is None when the database has no
+    UPDATE .. RETURNING (MySQL) and If-Match did not name a single version
+    """
+    if versions is not None:
+        where = (*where, model.version.in_(versions))
+    statement = (db.update(model).where(*where).values(version=model.version + 1, **values)
+                 .execution_options(synchronize_session=False))
+    if db.session.get_bind().dialect.update_returning:
+        version = db.session.execute(statement.returning(model.version)).scalar()
+        return version is not None, version
+    matched = db.session.execute(statement).rowcount > 0
+    return matched, versions[0] + 1 if matched and versions and len(versions) == 1 else None
+
+
+def version_response(body, status, version):
+    """
+    Response tagged with the row version, the ETag to send back in If-Match
+    """
+    response = make_response(jsonify(body), status)
+    if version is not None:
+        response.set_etag(str(version))
+    return response
+
+
+def precondition_failed(version):
+    return version_response({"message": "It was changed since you read it, reload and retry",
+                             "version": version}, 412, version)